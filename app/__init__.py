@@ -7,11 +7,20 @@ import os
 load_dotenv()
 
 
-def create_app() -> Flask:
+def create_app(warmup: bool = False) -> Flask:
+    """
+    warmup=True — сразу загрузить входные данные и индекс /api/essays (WARMUP_ON_START=1),
+    чтобы первый запрос не платил за загрузку. С gunicorn preload_app это происходит
+    в мастере один раз, до fork воркеров (см. gunicorn.conf.py).
+    """
     app = Flask(__name__)
     app.config.from_object(Config)
     app.register_blueprint(bp)
 
+    if warmup and app.config.get("WARMUP_ON_START", True):
+        from .warmup import warm_data
+        warm_data(app)
+
     # Проверка рабочей директории при запуске (для отладки)
     if app.config.get("DEBUG", False):
         print(f"[DEBUG] Working directory: {os.getcwd()}")
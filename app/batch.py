@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from flask import current_app
+
+from .schemas import ScoreRequest, validate_score_output
+from .scoring import ascore_essay, ascore_pack, max_pack_size, pack_key
+from .llm_cache import CACHE_USE
+from .deadline import Deadline
+
+BatchItem = Union[ScoreRequest, Dict[str, Any]]
+
+
+def _to_request(item: BatchItem) -> ScoreRequest:
+    if isinstance(item, ScoreRequest):
+        return item
+    return ScoreRequest.from_json(item)
+
+
+def _item_essay_id(item: BatchItem) -> Optional[str]:
+    if isinstance(item, ScoreRequest):
+        return item.essay_id
+    return item.get("essay_id")
+
+
+async def score_batch_async(
+    items: List[BatchItem],
+    concurrency: int,
+    on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+    cache_mode: str = CACHE_USE,
+    pack_size: int = 1,
+    deadline: Optional[Deadline] = None,
+    cancel: Optional[threading.Event] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Оценивает пачку сочинений параллельно, не больше `concurrency` одновременных вызовов.
+
+    deadline — общий срок всей пачки: элементы, до которых очередь дошла слишком
+    поздно, сразу завершаются ошибкой (кроме ответов из кеша), а не держат воркер.
+
+    cancel — отмена (например, клиент потока отключился): ещё не начатые элементы
+    завершаются ошибкой "cancelled" без вызова LLM; уже идущие вызовы дорабатывают.
+
+    pack_size > 1 — сочинения с общим опорным текстом/заданием/типом оцениваются
+    группами по pack_size одним вызовом LLM (score_pack); не попавшие в ответ —
+    по одному.
+
+    Возвращает список той же длины и в том же порядке, что и items.
+    Каждый элемент: {"index", "essay_id", "ok", "result" | "error", "elapsed_ms"}.
+    on_result(index, entry) вызывается сразу по готовности каждого элемента.
+    """
+    sem = asyncio.Semaphore(max(1, int(concurrency)))
+    out: List[Optional[Dict[str, Any]]] = [None] * len(items)
+
+    def _cancelled() -> bool:
+        return cancel is not None and cancel.is_set()
+
+    def _finish(i: int, entry: Dict[str, Any], started: float) -> None:
+        entry["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        out[i] = entry
+        if on_result is not None:
+            on_result(i, entry)
+
+    async def _one(i: int, item: BatchItem) -> None:
+        async with sem:
+            started = time.perf_counter()
+            entry: Dict[str, Any] = {"index": i, "essay_id": _item_essay_id(item)}
+            if _cancelled():
+                entry.update(ok=False, error="cancelled")
+                _finish(i, entry, started)
+                return
+            try:
+                res = await ascore_essay(_to_request(item), cache_mode=cache_mode, deadline=deadline)
+                validate_score_output(res)
+                entry.update(ok=True, result=res)
+            except Exception as e:
+                entry.update(ok=False, error=str(e))
+            _finish(i, entry, started)
+
+    async def _pack(chunk: List[Tuple[int, ScoreRequest]]) -> None:
+        started = time.perf_counter()
+        try:
+            async with sem:
+                if _cancelled():
+                    raise RuntimeError("cancelled")
+                done = await ascore_pack([req for _, req in chunk], cache_mode=cache_mode, deadline=deadline)
+        except Exception:
+            done = {}
+        rest = []
+        for i, req in chunk:
+            res = done.get(str(req.essay_id))
+            if res is None:
+                rest.append((i, req))
+            else:
+                _finish(i, {"index": i, "essay_id": req.essay_id, "ok": True, "result": res}, started)
+        # кого модель пропустила или вернула неполным — оцениваем по одному
+        await asyncio.gather(*(_one(i, req) for i, req in rest))
+
+    if pack_size <= 1:
+        tasks = [_one(i, item) for i, item in enumerate(items)]
+    else:
+        tasks = []
+        for chunk in _make_packs(items, pack_size):
+            tasks.append(_pack(chunk) if len(chunk) > 1 else _one(*chunk[0]))
+
+    await asyncio.gather(*tasks)
+    return out
+
+
+def _make_packs(items: List[BatchItem], pack_size: int) -> List[List[Tuple[int, BatchItem]]]:
+    """Группирует элементы по pack_key и режет на пачки; невалидные и без essay_id — по одному."""
+    groups: Dict[Tuple, List[Tuple[int, ScoreRequest]]] = {}
+    singles: List[List[Tuple[int, BatchItem]]] = []
+    for i, item in enumerate(items):
+        try:
+            req = _to_request(item)
+        except Exception:
+            singles.append([(i, item)])
+            continue
+        members = groups.setdefault(pack_key(req), [])
+        if req.essay_id is None or any(r.essay_id == req.essay_id for _, r in members):
+            singles.append([(i, req)])
+        else:
+            members.append((i, req))
+
+    packs: List[List[Tuple[int, BatchItem]]] = []
+    for members in groups.values():
+        for k in range(0, len(members), pack_size):
+            packs.append(members[k:k + pack_size])
+    return packs + singles
+
+
+def score_batch(
+    items: List[BatchItem],
+    concurrency: Optional[int] = None,
+    cache_mode: str = CACHE_USE,
+    pack_size: Optional[int] = None,
+    on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+    deadline: Optional[Deadline] = None,
+    cancel: Optional[threading.Event] = None,
+) -> List[Dict[str, Any]]:
+    """Синхронная обёртка над score_batch_async для Flask-роутов и скриптов (нужен app context)."""
+    if concurrency is None:
+        concurrency = current_app.config.get("SCORING_CONCURRENCY", 4)
+    if pack_size is None:
+        pack_size = current_app.config.get("SCORING_PACK_SIZE", 1)
+    # ответ пачки должен уместиться в лимит модели; structured output — только по одному
+    pack_size = min(pack_size, max_pack_size())
+    return asyncio.run(
+        score_batch_async(
+            items, concurrency, on_result=on_result, cache_mode=cache_mode, pack_size=pack_size,
+            deadline=deadline, cancel=cancel,
+        )
+    )
+
+
+def split_results(entries: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Приводит результат движка к привычному формату {"results": [...], "errors": [...]}
+    (порядок как во входных items) + "timings" — время оценки каждого элемента.
+    """
+    results = [e["result"] for e in entries if e["ok"]]
+    errors = [{"essay_id": e["essay_id"], "error": e["error"]} for e in entries if not e["ok"]]
+    timings = [
+        {"index": e["index"], "essay_id": e["essay_id"], "ok": e["ok"], "elapsed_ms": e["elapsed_ms"]}
+        for e in entries
+    ]
+    return {"results": results, "errors": errors, "timings": timings}
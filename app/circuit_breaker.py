@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """GigaChat считается недоступным: вызов отклонён сразу, повторить через retry_after секунд."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Предохранитель вызовов GigaChat (на процесс):
+    - closed: вызовы идут, исходы за последние window_sec запоминаются;
+      при min_calls и доле ошибок >= error_rate (или медленных >= slow_rate) — open
+    - open: вызовы сразу отклоняются CircuitOpenError на open_sec
+    - half_open: пропускается не больше half_open_probes пробных вызовов;
+      все успешны — closed, любая ошибка — снова open
+    Ошибка — 5xx, обрыв соединения, таймаут; 429 и 4xx — «нейтральные» (бэкенд жив).
+    """
+
+    def __init__(
+        self,
+        window_sec: float = 30.0,
+        min_calls: int = 5,
+        error_rate: float = 0.5,
+        slow_call_sec: float = 30.0,
+        slow_rate: float = 0.8,
+        open_sec: float = 20.0,
+        half_open_probes: int = 2,
+    ):
+        self.window_sec = float(window_sec)
+        self.min_calls = max(1, int(min_calls))
+        self.error_rate = float(error_rate)
+        self.slow_call_sec = float(slow_call_sec)
+        self.slow_rate = float(slow_rate)
+        self.open_sec = float(open_sec)
+        self.half_open_probes = max(1, int(half_open_probes))
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        # (время, ошибка, медленный) последних вызовов в состоянии closed
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()
+        self._open_until = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+        self._opened_total = 0
+        self._rejected_total = 0
+        self._last_trip: Optional[str] = None
+
+    def _trip(self, now: float, reason: str) -> None:
+        self._state = OPEN
+        self._open_until = now + self.open_sec
+        self._calls.clear()
+        self._opened_total += 1
+        self._last_trip = reason
+
+    def _advance(self, now: float) -> None:
+        # open -> half_open по истечении open_sec (проверяется лениво, без таймеров)
+        if self._state == OPEN and now >= self._open_until:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+
+    def _reject(self, now: float) -> CircuitOpenError:
+        self._rejected_total += 1
+        if self._state == OPEN:
+            retry_after = self._open_until - now
+            return CircuitOpenError(
+                f"GigaChat circuit is open ({self._last_trip}), retry in {retry_after:.0f}s", retry_after
+            )
+        return CircuitOpenError("GigaChat circuit is half-open, probe calls in progress", 1.0)
+
+    def check(self) -> None:
+        """Бросает CircuitOpenError, если вызов сейчас точно будет отклонён (слот пробы не занимает)."""
+        now = time.monotonic()
+        with self._lock:
+            self._advance(now)
+            if self._state == OPEN or (
+                self._state == HALF_OPEN and self._probes_in_flight >= self.half_open_probes
+            ):
+                raise self._reject(now)
+
+    def acquire(self) -> bool:
+        """Разрешение на вызов; True — это пробный вызов half_open (исход обязательно передать в record)."""
+        now = time.monotonic()
+        with self._lock:
+            self._advance(now)
+            if self._state == CLOSED:
+                return False
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+            raise self._reject(now)
+
+    def record(self, outcome: str, elapsed: float, probe: bool = False) -> None:
+        """outcome: "ok" / "error" / "neutral"; elapsed — длительность вызова в секундах."""
+        now = time.monotonic()
+        failed = outcome == "error"
+        slow = outcome == "ok" and elapsed >= self.slow_call_sec
+        with self._lock:
+            if probe:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if self._state != HALF_OPEN or outcome == "neutral":
+                    return
+                if failed or slow:
+                    self._trip(now, "probe failed" if failed else "probe too slow")
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._state = CLOSED
+                return
+
+            if self._state != CLOSED or outcome == "neutral":
+                return
+            self._calls.append((now, failed, slow))
+            while self._calls and self._calls[0][0] < now - self.window_sec:
+                self._calls.popleft()
+            n = len(self._calls)
+            if n < self.min_calls:
+                return
+            errors = sum(1 for _, f, _ in self._calls if f)
+            slows = sum(1 for _, _, s in self._calls if s)
+            if errors / n >= self.error_rate:
+                self._trip(now, f"error rate {errors}/{n}")
+            elif slows / n >= self.slow_rate:
+                self._trip(now, f"slow calls {slows}/{n} over {self.slow_call_sec:.0f}s")
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            self._advance(now)
+            n = len(self._calls)
+            errors = sum(1 for _, f, _ in self._calls if f)
+            return {
+                "state": self._state,
+                "retry_after": round(max(0.0, self._open_until - now), 1) if self._state == OPEN else 0.0,
+                "window_calls": n,
+                "window_errors": errors,
+                "window_error_rate": round(errors / n, 3) if n else 0.0,
+                "probes_in_flight": self._probes_in_flight,
+                "opened_total": self._opened_total,
+                "rejected_total": self._rejected_total,
+                "last_trip": self._last_trip,
+            }
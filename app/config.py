@@ -1,4 +1,10 @@
 import os
+from pathlib import Path
+
+# Каталог для персистентных файлов: на Amvera это persistenceMount (/data),
+# локально — data/ в корне проекта
+_PROJECT_DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+_DEFAULT_PERSIST_DIR = "/data" if os.path.isdir("/data") else str(_PROJECT_DATA_DIR)
 
 class Config:
     # Flask
@@ -8,9 +14,92 @@ class Config:
     GIGACHAT_TOKEN = os.getenv("GIGACHAT_TOKEN", "")
     GIGACHAT_MODEL = os.getenv("GIGACHAT_MODEL", "GigaChat")
     TEMPERATURE = float(os.getenv("TEMPERATURE", "0.0"))
-    PROMPT_VERSION = os.getenv("PROMPT_VERSION", "v1.1")
+    # v1.2 — только шкала нужного essay_type; v1.1 — исходный промпт со всеми шкалами
+    PROMPT_VERSION = os.getenv("PROMPT_VERSION", "v1.2")
+    # Бюджет входных токенов промпта (оценка); 0 — без ограничения
+    PROMPT_INPUT_TOKEN_BUDGET = int(os.getenv("PROMPT_INPUT_TOKEN_BUDGET", "0"))
     MAX_TOKENS = int(os.getenv("MAX_TOKENS", "900"))
+    # Предел max_tokens одного вызова у модели: пачка (SCORING_PACK_SIZE) не больше лимита // MAX_TOKENS
+    GIGACHAT_MAX_OUTPUT_TOKENS = int(os.getenv("GIGACHAT_MAX_OUTPUT_TOKENS", "4096"))
+    GIGACHAT_POOL_SIZE = int(os.getenv("GIGACHAT_POOL_SIZE", "10"))
+    # Function calling: схема ответа K1–K4 передаётся как функция (opt-in)
+    GIGACHAT_STRUCTURED_OUTPUT = os.getenv("GIGACHAT_STRUCTURED_OUTPUT", "0") == "1"
+
+    # Регулятор нагрузки на GigaChat (token bucket + AIMD по числу одновременных запросов)
+    GIGACHAT_RATE_PER_SEC = float(os.getenv("GIGACHAT_RATE_PER_SEC", "5"))
+    GIGACHAT_BURST = int(os.getenv("GIGACHAT_BURST", "5"))
+    GIGACHAT_INITIAL_CONCURRENCY = int(os.getenv("GIGACHAT_INITIAL_CONCURRENCY", "4"))
+    GIGACHAT_MIN_CONCURRENCY = int(os.getenv("GIGACHAT_MIN_CONCURRENCY", "1"))
+    GIGACHAT_MAX_CONCURRENCY = int(os.getenv("GIGACHAT_MAX_CONCURRENCY", "16"))
+    GIGACHAT_THROTTLE_RETRIES = int(os.getenv("GIGACHAT_THROTTLE_RETRIES", "3"))
+    # Повторы вызовов GigaChat: пауза full jitter от RETRY_BASE_DELAY_SEC до RETRY_MAX_DELAY_SEC;
+    # за RETRY_BUDGET_WINDOW_SEC повторов не больше RETRY_BUDGET_RATIO * вызовов
+    # + min(RETRY_BUDGET_MIN_PER_SEC * окно, вызовов) (на процесс)
+    RETRY_BASE_DELAY_SEC = float(os.getenv("RETRY_BASE_DELAY_SEC", "0.5"))
+    RETRY_MAX_DELAY_SEC = float(os.getenv("RETRY_MAX_DELAY_SEC", "8"))
+    RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+    RETRY_BUDGET_MIN_PER_SEC = float(os.getenv("RETRY_BUDGET_MIN_PER_SEC", "0.1"))
+    RETRY_BUDGET_WINDOW_SEC = float(os.getenv("RETRY_BUDGET_WINDOW_SEC", "10"))
+
+    # Параллельная оценка пачек (сколько сочинений одновременно ждут ответа GigaChat)
+    SCORING_CONCURRENCY = int(os.getenv("SCORING_CONCURRENCY", "4"))
+    # Сколько сочинений с общим опорным текстом оценивать одним вызовом (1 = по одному;
+    # при GIGACHAT_STRUCTURED_OUTPUT=1 всегда по одному)
+    SCORING_PACK_SIZE = int(os.getenv("SCORING_PACK_SIZE", "1"))
+
+    # Склейка одинаковых одновременных запросов на оценку (singleflight)
+    SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "1") == "1"
+
+    # Persistence
+    PERSIST_DIR = os.getenv("PERSIST_DIR", _DEFAULT_PERSIST_DIR)
+
+    # Кеш ответов LLM (SQLite)
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+    LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(PERSIST_DIR, "llm_cache.sqlite3"))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+    LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "200"))
+    LLM_CACHE_TTL_SEC = int(os.getenv("LLM_CACHE_TTL_SEC", str(30 * 24 * 3600)))
+
+    # Асинхронные задания /jobs (очередь в SQLite + фоновые потоки в каждом процессе)
+    JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(PERSIST_DIR, "jobs.sqlite3"))
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_MAX_ITEMS = int(os.getenv("JOB_MAX_ITEMS", "2000"))
+    # через сколько секунд элемент упавшего воркера снова попадает в очередь
+    JOB_LEASE_SEC = int(os.getenv("JOB_LEASE_SEC", "300"))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_TTL_SEC = int(os.getenv("JOB_TTL_SEC", str(7 * 24 * 3600)))
+
+    # Входные данные: как часто проверять файлы на изменения (сек; 0 — без горячей перезагрузки)
+    DATA_RELOAD_INTERVAL_SEC = float(os.getenv("DATA_RELOAD_INTERVAL_SEC", "10"))
+    # /api/essays: размер страницы по умолчанию и максимум
+    ESSAYS_PAGE_SIZE = int(os.getenv("ESSAYS_PAGE_SIZE", "100"))
+    ESSAYS_MAX_PAGE_SIZE = int(os.getenv("ESSAYS_MAX_PAGE_SIZE", "500"))
+    # Токен для /admin/* (заголовок X-Admin-Token); пусто — эндпоинты отключены (403)
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+    # Прогрев при старте (wsgi/run.py): данные и индекс до первого запроса, OAuth-токен в воркере
+    WARMUP_ON_START = os.getenv("WARMUP_ON_START", "1") == "1"
 
     # Safety
     MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "20"))
     REQUEST_TIMEOUT_SEC = int(os.getenv("REQUEST_TIMEOUT_SEC", "60"))
+    # Общий срок HTTP-запроса на оценку (меньше таймаута gunicorn 120 с): все вызовы GigaChat
+    # укладываются в него; шаг, которому осталось меньше DEADLINE_MIN_CALL_SEC, не начинается
+    REQUEST_DEADLINE_SEC = float(os.getenv("REQUEST_DEADLINE_SEC", "100"))
+    DEADLINE_MIN_CALL_SEC = float(os.getenv("DEADLINE_MIN_CALL_SEC", "3"))
+    # Предохранитель GigaChat: при доле ошибок (или медленных ответов) за окно — быстрый отказ 503
+    CIRCUIT_ENABLED = os.getenv("CIRCUIT_ENABLED", "1") == "1"
+    CIRCUIT_WINDOW_SEC = float(os.getenv("CIRCUIT_WINDOW_SEC", "30"))
+    CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+    CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+    CIRCUIT_SLOW_CALL_SEC = float(os.getenv("CIRCUIT_SLOW_CALL_SEC", "30"))
+    CIRCUIT_SLOW_RATE = float(os.getenv("CIRCUIT_SLOW_RATE", "0.8"))
+    CIRCUIT_OPEN_SEC = float(os.getenv("CIRCUIT_OPEN_SEC", "20"))
+    CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "2"))
+    # Хеджирование /score_one и /ui/score_one: дубликат вызова, если ответа нет дольше квантиля
+    # HEDGE_QUANTILE времени ответа (не раньше HEDGE_MIN_DELAY_SEC); дубликатов — не больше
+    # HEDGE_MAX_EXTRA_RATIO от числа вызовов
+    HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "0") == "1"
+    HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+    HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    HEDGE_MIN_DELAY_SEC = float(os.getenv("HEDGE_MIN_DELAY_SEC", "1"))
+    HEDGE_MAX_EXTRA_RATIO = float(os.getenv("HEDGE_MAX_EXTRA_RATIO", "0.1"))
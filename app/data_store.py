@@ -1,78 +1,446 @@
-import pandas as pd
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 import os
+import sys
 
-_DATA = None
 
-def load_inputs(path: str = None):
-    """Загружает данные из CSV файла. Путь определяется относительно корня проекта."""
-    global _DATA
-    if _DATA is None:
-        if path is None:
-            # Определяем корень проекта (где находится wsgi.py или app/)
-            base_dir = Path(__file__).resolve().parent.parent
-            path = base_dir / "data" / "inputs_for_scoring.csv"
-        else:
-            path = Path(path)
-            if not path.is_absolute():
-                # Если путь относительный, делаем его относительно корня проекта
-                base_dir = Path(__file__).resolve().parent.parent
-                path = base_dir / path
-
-        if not path.exists():
-            raise FileNotFoundError(
-                f"Not found: {path}. Run scripts/prepare_inputs.py first. "
-                f"Current working directory: {os.getcwd()}"
-            )
-        _DATA = pd.read_csv(path)
-        _DATA["essay_id"] = _DATA["essay_id"].astype(str)
-    return _DATA
+# pandas и pyarrow тяжёлые (сотни мс на импорт) — импортируем только при загрузке данных
+def _pandas():
+    import pandas as pd
+    return pd
+
 
-def get_by_essay_id(essay_id: str):
-    df = load_inputs()
-    row = df[df["essay_id"] == str(essay_id)]
-    if row.empty:
+def _pyarrow():
+    """Опциональный Arrow-бэкенд (memory map); None — pyarrow не установлен, читаем CSV."""
+    try:
+        import pyarrow as pa
+    except ImportError:
         return None
-    r = row.iloc[0].to_dict()
-    # оставим только нужное
+    return pa
+
+
+@dataclass(frozen=True, slots=True)
+class EssayRecord:
+    """Одно сочинение из входных данных (лёгкая неизменяемая запись без __dict__)."""
+    essay_id: str
+    essay_type: int
+    task_text: str
+    reference_text_essay: str
+    essay_text: str
+
+    def to_dict(self) -> Dict:
+        return {
+            "essay_id": self.essay_id,
+            "essay_type": self.essay_type,
+            "task_text": self.task_text,
+            "reference_text_essay": self.reference_text_essay,
+            "essay_text": self.essay_text,
+        }
+
+
+def _preview(text: str, limit: int) -> str:
+    return text[:limit] + "..." if len(text) > limit else text
+
+
+def _summary(rec: EssayRecord) -> Dict:
+    # Берем первые 100 символов эссе и 150 символов задания для превью
     return {
-        "essay_id": str(r["essay_id"]),
-        "essay_type": int(r["essay_type"]),
-        "task_text": str(r["task_text"]),
-        "reference_text_essay": str(r["reference_text_essay"]),
-        "essay_text": str(r["essay_text"]),
+        "essay_id": rec.essay_id,
+        "essay_type": rec.essay_type,
+        "task_text": _preview(rec.task_text, 150),
+        "essay_preview": _preview(rec.essay_text, 100),
+        "essay_length": len(rec.essay_text),
     }
 
-def get_all_essays():
-    """Возвращает список всех сочинений с краткой информацией."""
-    df = load_inputs()
-    result = []
-    for _, row in df.iterrows():
-        essay_text = str(row["essay_text"])
-        # Берем первые 100 символов для превью
-        preview = essay_text[:100] + "..." if len(essay_text) > 100 else essay_text
-        result.append({
-            "essay_id": str(row["essay_id"]),
-            "essay_type": int(row["essay_type"]),
-            "task_text": str(row["task_text"])[:150] + "..." if len(str(row["task_text"])) > 150 else str(row["task_text"]),
+
+class EssayDataset:
+    """
+    Загруженные данные: индекс essay_id -> номер строки и готовый список для /api/essays
+    (строятся один раз при загрузке). Сами записи отдаёт бэкенд по номеру строки:
+    для CSV — из памяти, для Arrow — лениво из memory-mapped файла.
+    """
+    __slots__ = (
+        "path", "backend", "_row", "_count", "_index", "listing",
+        # метаданные снимка для горячей перезагрузки (заполняет _build)
+        "stamp", "digest", "loaded_at", "load_ms",
+    )
+
+    def __init__(
+        self,
+        path: Path,
+        backend: str,
+        essay_ids: Sequence[str],
+        row: Callable[[int], EssayRecord],
+        listing: List[Dict],
+    ):
+        self.path = path
+        self.backend = backend
+        self._row = row
+        self._count = len(essay_ids)
+        self._index: Dict[str, int] = {}
+        for i, essay_id in enumerate(essay_ids):
+            # при повторе essay_id побеждает первая строка (как раньше с row.iloc[0])
+            self._index.setdefault(essay_id, i)
+        self.listing = listing
+        self.stamp: Tuple = ()
+        self.digest = ""
+        self.loaded_at = 0.0
+        self.load_ms = 0.0
+
+    @classmethod
+    def from_records(cls, path: Path, backend: str, records: Sequence[EssayRecord]) -> "EssayDataset":
+        records = tuple(records)
+        return cls(path, backend, [r.essay_id for r in records], records.__getitem__, [_summary(r) for r in records])
+
+    def get(self, essay_id: str) -> Optional[EssayRecord]:
+        i = self._index.get(str(essay_id))
+        return None if i is None else self._row(i)
+
+    def __iter__(self) -> Iterator[EssayRecord]:
+        for i in range(self._count):
+            yield self._row(i)
+
+    def __len__(self) -> int:
+        return self._count
+
+
+# Текущий снимок данных. Подменяется целиком (присваивание атомарно): запросы,
+# уже взявшие старый снимок, дорабатывают с ним
+_DATA: Optional[EssayDataset] = None
+_DATA_LOCK = threading.Lock()
+_DATA_ARG: Optional[str] = None  # путь, с которым впервые вызвали load_inputs
+# одна перезагрузка за раз; статистика — для /api/metrics
+_RELOAD_LOCK = threading.Lock()
+_RELOAD_STATS = {"checks": 0, "reloads": 0, "last_error": None}
+_FAILED_STAMP: Optional[Tuple] = None
+_WATCHER: Optional[threading.Thread] = None
+
+# Файлы, которые пишет scripts/prepare_inputs.py
+ESSAYS_FILE = "inputs_essays.csv"
+REFERENCES_FILE = "inputs_references.csv"
+LEGACY_FILE = "inputs_for_scoring.csv"
+# --format arrow: Arrow IPC (без сжатия, открывается через memory map)
+ESSAYS_ARROW_FILE = "inputs_essays.arrow"
+REFERENCES_ARROW_FILE = "inputs_references.arrow"
+
+
+def _resolve_path(path: Optional[str]) -> Path:
+    """
+    Путь к данным: каталог с подготовленными файлами или один legacy CSV.
+    По умолчанию — data/ в корне проекта, если там есть нормализованный формат,
+    иначе data/inputs_for_scoring.csv.
+    """
+    # Определяем корень проекта (где находится wsgi.py или app/)
+    base_dir = Path(__file__).resolve().parent.parent
+    if path is None:
+        data_dir = base_dir / "data"
+        if _has_arrow(data_dir) or ((data_dir / ESSAYS_FILE).exists() and (data_dir / REFERENCES_FILE).exists()):
+            return data_dir
+        return data_dir / LEGACY_FILE
+    path = Path(path)
+    if not path.is_absolute():
+        # Если путь относительный, делаем его относительно корня проекта
+        path = base_dir / path
+    return path
+
+
+def _has_arrow(data_dir: Path) -> bool:
+    return (data_dir / ESSAYS_ARROW_FILE).exists() and (data_dir / REFERENCES_ARROW_FILE).exists()
+
+
+def _arrow_is_current(data_dir: Path) -> bool:
+    """
+    Arrow-файлы пишутся после CSV тем же запуском prepare_inputs. Если какой-то CSV
+    новее Arrow (перезаписан без --format arrow), Arrow устарел — читаем CSV.
+    """
+    csv_files = [data_dir / ESSAYS_FILE, data_dir / REFERENCES_FILE]
+    if not all(f.exists() for f in csv_files):
+        return True
+    try:
+        csv_mtime = max(f.stat().st_mtime_ns for f in csv_files)
+        arrow_mtime = min((data_dir / name).stat().st_mtime_ns for name in (ESSAYS_ARROW_FILE, REFERENCES_ARROW_FILE))
+    except OSError:
+        return False
+    return arrow_mtime >= csv_mtime
+
+
+def _read_references(refs_df) -> Dict[int, Tuple[str, str]]:
+    # Задание и опорный текст — по одному объекту str на reference_text_id (и intern),
+    # все записи с одним опорным текстом ссылаются на одну и ту же строку
+    return {
+        int(ref_id): (sys.intern(str(task_text)), sys.intern(str(reference_text)))
+        for ref_id, task_text, reference_text in zip(
+            refs_df["reference_text_id"], refs_df["task_text"], refs_df["reference_text_essay"]
+        )
+    }
+
+
+def _check_references(ref_ids: Sequence[int], refs: Dict[int, Tuple[str, str]], source: str) -> None:
+    unknown = sorted({int(r) for r in ref_ids} - set(refs))
+    if unknown:
+        raise ValueError(f"{source}: unknown reference_text_id {unknown}. Run scripts/prepare_inputs.py")
+
+
+def _load_normalized(data_dir: Path) -> EssayDataset:
+    """Нормализованный CSV: сочинения + справочник опорных текстов по reference_text_id."""
+    pd = _pandas()
+    refs = _read_references(pd.read_csv(data_dir / REFERENCES_FILE))
+
+    essays_df = pd.read_csv(data_dir / ESSAYS_FILE)
+    _check_references(essays_df["reference_text_id"], refs, ESSAYS_FILE)
+
+    records = []
+    for essay_id, essay_type, ref_id, essay_text in zip(
+        essays_df["essay_id"], essays_df["essay_type"], essays_df["reference_text_id"], essays_df["essay_text"]
+    ):
+        task_text, reference_text = refs[int(ref_id)]
+        records.append(EssayRecord(str(essay_id), int(essay_type), task_text, reference_text, str(essay_text)))
+    return EssayDataset.from_records(data_dir, "csv", records)
+
+
+def _load_legacy(path: Path) -> EssayDataset:
+    df = _pandas().read_csv(path)
+    # одинаковые задания/опорные тексты в разных строках — один общий объект str
+    shared: Dict[str, str] = {}
+    # по колонкам, без iterrows/to_dict на каждую строку
+    records = [
+        EssayRecord(
+            str(essay_id),
+            int(essay_type),
+            shared.setdefault(str(task_text), str(task_text)),
+            shared.setdefault(str(reference_text), str(reference_text)),
+            str(essay_text),
+        )
+        for essay_id, essay_type, task_text, reference_text, essay_text in zip(
+            df["essay_id"], df["essay_type"], df["task_text"], df["reference_text_essay"], df["essay_text"]
+        )
+    ]
+    return EssayDataset.from_records(path, "legacy_csv", records)
+
+
+def _load_arrow(data_dir: Path, pa) -> EssayDataset:
+    """
+    Arrow IPC через memory map: страницы файла делятся между gunicorn-воркерами через
+    page cache ОС, текст сочинения читается только при обращении к записи.
+    В памяти процесса — лишь essay_id, справочник опорных текстов и готовый список
+    (превью и длина посчитаны заранее в prepare_inputs).
+    """
+    refs_table = pa.ipc.open_file(pa.memory_map(str(data_dir / REFERENCES_ARROW_FILE), "r")).read_all()
+    refs = _read_references(refs_table.to_pydict())
+
+    essays = pa.ipc.open_file(pa.memory_map(str(data_dir / ESSAYS_ARROW_FILE), "r")).read_all()
+    essay_ids = [str(e) for e in essays.column("essay_id").to_pylist()]
+    essay_types = essays.column("essay_type").to_pylist()
+    ref_ids = essays.column("reference_text_id").to_pylist()
+    _check_references(ref_ids, refs, ESSAYS_ARROW_FILE)
+    essay_text = essays.column("essay_text")
+
+    def _row(i: int) -> EssayRecord:
+        task_text, reference_text = refs[ref_ids[i]]
+        return EssayRecord(essay_ids[i], essay_types[i], task_text, reference_text, essay_text[i].as_py())
+
+    task_previews = {ref_id: _preview(task, 150) for ref_id, (task, _) in refs.items()}
+    listing = [
+        {
+            "essay_id": essay_id,
+            "essay_type": essay_type,
+            "task_text": task_previews[ref_id],
             "essay_preview": preview,
-            "essay_length": len(essay_text),
-        })
-    return result
+            "essay_length": length,
+        }
+        for essay_id, essay_type, ref_id, preview, length in zip(
+            essay_ids,
+            essay_types,
+            ref_ids,
+            essays.column("essay_preview").to_pylist(),
+            essays.column("essay_length").to_pylist(),
+        )
+    ]
+    return EssayDataset(data_dir, "arrow", essay_ids, _row, listing)
+
+
+def _load(path: Path) -> EssayDataset:
+    if not path.is_dir():
+        return _load_legacy(path)
+    if _has_arrow(path) and not _arrow_is_current(path):
+        logging.getLogger(__name__).warning("Arrow inputs in %s are older than the CSV inputs, reading CSV", path)
+    elif _has_arrow(path):
+        pa = _pyarrow()
+        if pa is not None:
+            return _load_arrow(path, pa)
+        logging.getLogger(__name__).warning("pyarrow is not installed, reading CSV inputs from %s", path)
+    return _load_normalized(path)
+
+
+def _watched_files(path: Path) -> List[Path]:
+    # каталог: все форматы (появление Arrow-файлов тоже должно подхватиться)
+    if path.is_dir():
+        return [path / name for name in (
+            ESSAYS_FILE, REFERENCES_FILE, ESSAYS_ARROW_FILE, REFERENCES_ARROW_FILE, LEGACY_FILE,
+        )]
+    return [path]
+
+
+def _stamp(files: List[Path]) -> Tuple:
+    """Дешёвый отпечаток: (имя, mtime_ns, size) каждого файла; None — файла нет."""
+    out = []
+    for f in files:
+        try:
+            st = f.stat()
+            out.append((f.name, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            out.append((f.name, None))
+    return tuple(out)
+
+
+def _digest(files: List[Path]) -> str:
+    """sha256 содержимого — чтобы не перезагружаться, если файл лишь «потрогали»."""
+    h = hashlib.sha256()
+    for f in files:
+        h.update(f.name.encode("utf-8"))
+        if f.exists():
+            with open(f, "rb") as fh:
+                for chunk in iter(lambda: fh.read(1 << 20), b""):
+                    h.update(chunk)
+    return h.hexdigest()
+
+
+def _build(path_arg: Optional[str]) -> EssayDataset:
+    path = _resolve_path(path_arg)
+    if not path.exists():
+        raise FileNotFoundError(
+            f"Not found: {path}. Run scripts/prepare_inputs.py first. "
+            f"Current working directory: {os.getcwd()}"
+        )
+    files = _watched_files(path)
+    # отпечаток снимаем до чтения: изменение во время загрузки заметим на следующей проверке
+    stamp = _stamp(files)
+    started = time.perf_counter()
+    dataset = _load(path)
+    dataset.load_ms = round((time.perf_counter() - started) * 1000, 1)
+    dataset.stamp = stamp
+    dataset.digest = _digest(files)
+    dataset.loaded_at = time.time()
+    return dataset
+
+
+def load_inputs(path: str = None) -> EssayDataset:
+    """
+    Текущий снимок данных (загружается один раз на процесс, дальше — reload_inputs).
+    Путь определяется относительно корня проекта:
+    каталог — Arrow (если есть файлы и установлен pyarrow) или нормализованный CSV,
+    файл .csv — прежний inputs_for_scoring.csv.
+    """
+    global _DATA, _DATA_ARG
+    if _DATA is None:
+        with _DATA_LOCK:
+            if _DATA is None:
+                _DATA = _build(path)
+                _DATA_ARG = path
+    return _DATA
+
+
+def reload_inputs(force: bool = False) -> Dict:
+    """
+    Проверяет входные файлы (mtime/size, затем sha256) и, если они изменились
+    (или force=True), строит новый снимок и подменяет текущий.
+    Если новый снимок не собрался — остаётся старый, ошибка пробрасывается.
+    """
+    global _DATA, _FAILED_STAMP
+    with _RELOAD_LOCK:
+        _RELOAD_STATS["checks"] += 1
+        current = _DATA
+        if current is None:
+            load_inputs()
+            return {"reloaded": True, **data_stats()}
+
+        path = _resolve_path(_DATA_ARG)
+        files = _watched_files(path)
+        stamp = _stamp(files)
+        if not force and path == current.path:
+            # те же файлы или уже неудачная попытка на этой версии файлов
+            if stamp == current.stamp or stamp == _FAILED_STAMP:
+                return {"reloaded": False, **data_stats()}
+            if _digest(files) == current.digest:
+                current.stamp = stamp
+                return {"reloaded": False, **data_stats()}
+
+        try:
+            new = _build(_DATA_ARG)
+        except Exception as e:
+            _FAILED_STAMP = stamp
+            _RELOAD_STATS["last_error"] = f"{type(e).__name__}: {e}"
+            raise
+        _DATA = new
+        _FAILED_STAMP = None
+        _RELOAD_STATS["reloads"] += 1
+        _RELOAD_STATS["last_error"] = None
+    return {"reloaded": True, **data_stats()}
+
+
+def _watch_loop(interval_sec: float) -> None:
+    log = logging.getLogger(__name__)
+    while True:
+        time.sleep(interval_sec)
+        if _DATA is None:
+            # данные ещё ни разу не запрашивали — грузить заранее не нужно
+            continue
+        try:
+            result = reload_inputs()
+            if result["reloaded"]:
+                log.info("data_store: reloaded %s essays in %s ms", result["essays"], result["load_ms"])
+        except Exception as e:
+            log.warning("data_store: reload failed, keeping previous snapshot: %s", e)
+
+
+def start_watcher(interval_sec: float) -> bool:
+    """Фоновая проверка входных файлов раз в interval_sec (один поток на процесс; 0 — выключено)."""
+    global _WATCHER
+    with _RELOAD_LOCK:
+        if _WATCHER is not None or interval_sec <= 0:
+            return False
+        _WATCHER = threading.Thread(target=_watch_loop, args=(float(interval_sec),), name="data-watcher", daemon=True)
+        _WATCHER.start()
+    return True
+
+
+def data_stats() -> Dict:
+    """Состояние текущего снимка и перезагрузок (пусто, если данные ещё не загружались)."""
+    current = _DATA
+    if current is None:
+        return {}
+    return {
+        "path": str(current.path),
+        "backend": current.backend,
+        "essays": len(current),
+        "digest": current.digest[:16],
+        "loaded_at": current.loaded_at,
+        "load_ms": current.load_ms,
+        "watching": _WATCHER is not None,
+        **_RELOAD_STATS,
+    }
+
+
+def get_by_essay_id(essay_id: str) -> Optional[EssayRecord]:
+    return load_inputs().get(essay_id)
+
+
+def get_all_essays() -> List[Dict]:
+    """Возвращает список всех сочинений с краткой информацией (общий список — не изменять)."""
+    return load_inputs().listing
+
 
-def get_essays_by_ids(essay_ids: list):
-    """Возвращает полные данные для списка essay_id."""
-    df = load_inputs()
+def get_essays_by_ids(essay_ids: list) -> List[Dict]:
+    """Возвращает полные данные для списка essay_id (за один проход по списку, ненайденные пропускаются)."""
+    dataset = load_inputs()
     result = []
     for essay_id in essay_ids:
-        row = df[df["essay_id"] == str(essay_id)]
-        if not row.empty:
-            r = row.iloc[0].to_dict()
-            result.append({
-                "essay_id": str(r["essay_id"]),
-                "essay_type": int(r["essay_type"]),
-                "task_text": str(r["task_text"]),
-                "reference_text_essay": str(r["reference_text_essay"]),
-                "essay_text": str(r["essay_text"]),
-            })
+        rec = dataset.get(essay_id)
+        if rec is not None:
+            result.append(rec.to_dict())
     return result
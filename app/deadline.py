@@ -0,0 +1,58 @@
+import time
+from typing import Dict, Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Бюджет времени запроса исчерпан. partial — валидные поля ответа,
+    которые успели получить (может быть пустым).
+    """
+
+    def __init__(self, message: str, partial: Optional[Dict] = None):
+        super().__init__(message)
+        self.partial = partial or {}
+
+
+class Deadline:
+    """
+    Абсолютный срок запроса (по monotonic): задаётся один раз в роуте и передаётся
+    вниз до каждого chat_completion, который получает таймаут не больше остатка.
+    """
+
+    __slots__ = ("expires_at", "min_call_sec")
+
+    def __init__(self, expires_at: float, min_call_sec: float = 0.0):
+        self.expires_at = expires_at
+        # шаг, которому осталось меньше min_call_sec, не начинаем: он всё равно не успеет
+        self.min_call_sec = min_call_sec
+
+    @classmethod
+    def after(cls, seconds: float, min_call_sec: float = 0.0) -> "Deadline":
+        return cls(time.monotonic() + seconds, min_call_sec)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def allows(self, seconds: Optional[float] = None) -> bool:
+        """Хватает ли времени на шаг длиной seconds (по умолчанию min_call_sec)."""
+        need = self.min_call_sec if seconds is None else seconds
+        left = self.remaining()
+        return left > 0.0 and left >= need
+
+    def timeout(self, cap: float, what: str = "call") -> float:
+        """
+        Таймаут очередного шага: min(cap, остаток). Бросает DeadlineExceeded,
+        если остатка не хватает даже на min_call_sec.
+        """
+        if not self.allows():
+            raise DeadlineExceeded(f"deadline exceeded before {what} ({self.remaining():.1f}s left)")
+        return min(float(cap), self.remaining())
+
+
+def clamp_timeout(cap: float, deadline: Optional[Deadline], what: str = "call") -> float:
+    """Таймаут шага с учётом (необязательного) дедлайна."""
+    return float(cap) if deadline is None else deadline.timeout(cap, what)
@@ -0,0 +1,210 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from .data_store import EssayDataset
+
+# Файл индекса, который никто не открывал дольше этого, считается брошенным (см. _cleanup);
+# открытый индекс процесс «трогает» (mtime) не реже раза в _TOUCH_EVERY_SEC
+_CLEANUP_AGE_SEC = 3600.0
+_TOUCH_EVERY_SEC = 300.0
+
+
+class StaleCursorError(ValueError):
+    """Курсор выдан для другой версии данных (данные перезагрузились) — начните с первой страницы."""
+
+
+class EssayIndex:
+    """
+    Индекс для /api/essays поверх одного снимка данных: SQLite-файл с FTS5
+    (essay_id, текст сочинения, задание) и типом сочинения.
+    Файл строится один раз на версию данных (digest) и общий для всех воркеров;
+    сами карточки берутся из готового listing снимка по номеру строки.
+    """
+
+    def __init__(self, dataset: EssayDataset, path: Path):
+        self.dataset = dataset
+        self.version = dataset.digest[:16]
+        self.path = path
+        if not path.exists():
+            self._build(dataset, path)
+        try:
+            self._conn = self._open(path)
+        except sqlite3.DatabaseError:
+            # файл удалили или он битый (чужой _cleanup, оборванная запись) — строим заново
+            self._build(dataset, path)
+            self._conn = self._open(path)
+        self._lock = threading.Lock()
+        self._touched = 0.0
+        self._touch()
+
+    @staticmethod
+    def _open(path: Path) -> sqlite3.Connection:
+        # только чтение; check_same_thread=False + lock — одно соединение на процесс
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        try:
+            conn.execute("SELECT 1 FROM essays LIMIT 1").fetchall()
+        except sqlite3.DatabaseError:
+            conn.close()
+            raise
+        return conn
+
+    def _touch(self) -> None:
+        # mtime — отметка «индекс используется», по ней _cleanup не трогает живые файлы
+        now = time.time()
+        if now - self._touched < _TOUCH_EVERY_SEC:
+            return
+        self._touched = now
+        try:
+            os.utime(self.path, (now, now))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _build(dataset: EssayDataset, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # строим во временный файл и переименовываем: другой воркер мог строить тот же индекс
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        conn = sqlite3.connect(str(tmp))
+        try:
+            conn.executescript(
+                """
+                CREATE TABLE essays (rowid INTEGER PRIMARY KEY, essay_type INTEGER NOT NULL);
+                CREATE INDEX idx_essays_type ON essays(essay_type, rowid);
+                CREATE VIRTUAL TABLE essays_fts USING fts5(
+                    essay_id, essay_text, task_text, tokenize = 'unicode61 remove_diacritics 2'
+                );
+                """
+            )
+            # rowid = номер строки в снимке + 1
+            for rowid, rec in enumerate(dataset, start=1):
+                conn.execute("INSERT INTO essays (rowid, essay_type) VALUES (?, ?)", (rowid, rec.essay_type))
+                conn.execute(
+                    "INSERT INTO essays_fts (rowid, essay_id, essay_text, task_text) VALUES (?, ?, ?, ?)",
+                    (rowid, rec.essay_id, rec.essay_text, rec.task_text),
+                )
+            conn.commit()
+            conn.execute("INSERT INTO essays_fts(essays_fts) VALUES ('optimize')")
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _match_expr(q: str) -> Optional[str]:
+        # запрос пользователя -> FTS5: каждое слово — префиксный поиск, все слова обязательны
+        words = re.findall(r"\w+", q.lower())
+        if not words:
+            return None
+        return " AND ".join(f'"{w}"*' for w in words)
+
+    def _parse_cursor(self, cursor: Optional[str]) -> int:
+        if not cursor:
+            return 0
+        version, _, after = cursor.partition(":")
+        if version != self.version:
+            raise StaleCursorError("cursor is stale (data was reloaded), request the first page again")
+        try:
+            return int(after)
+        except ValueError:
+            raise ValueError("invalid cursor")
+
+    def query(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        essay_type: Optional[int] = None,
+        q: Optional[str] = None,
+    ) -> Dict:
+        """Страница карточек в порядке файла: {"essays", "next_cursor", "total"}."""
+        after = self._parse_cursor(cursor)
+
+        joins, where, params = "", [], []
+        match = self._match_expr(q) if q else None
+        if q and match is None:
+            return {"essays": [], "next_cursor": None, "total": 0}
+        if match is not None:
+            joins = "JOIN essays_fts f ON f.rowid = e.rowid"
+            where.append("essays_fts MATCH ?")
+            params.append(match)
+        if essay_type is not None:
+            where.append("e.essay_type = ?")
+            params.append(int(essay_type))
+        where_sql = " AND ".join(where) if where else "1"
+
+        self._touch()
+        with self._lock:
+            total = self._conn.execute(
+                f"SELECT COUNT(*) FROM essays e {joins} WHERE {where_sql}", params
+            ).fetchone()[0]
+            rowids = [r[0] for r in self._conn.execute(
+                f"SELECT e.rowid FROM essays e {joins} WHERE {where_sql} AND e.rowid > ? ORDER BY e.rowid LIMIT ?",
+                params + [after, limit + 1],
+            )]
+
+        has_more = len(rowids) > limit
+        rowids = rowids[:limit]
+        listing = self.dataset.listing
+        return {
+            "essays": [listing[r - 1] for r in rowids],
+            "next_cursor": f"{self.version}:{rowids[-1]}" if has_more else None,
+            "total": total,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# Индекс текущего снимка данных (на процесс); после перезагрузки данных строится заново
+_INDEX: Optional[EssayIndex] = None
+_INDEX_LOCK = threading.Lock()
+
+
+def _index_path(persist_dir: str, version: str) -> Path:
+    return Path(persist_dir) / "essay_index" / f"essays_{version}.sqlite3"
+
+
+def _cleanup(directory: Path, keep: Path, max_age: float = _CLEANUP_AGE_SEC) -> None:
+    # только брошенные версии индекса: другой воркер может ещё работать со старым снимком
+    # (его файл свежий — он его трогает) или уже построить более новый
+    edge = time.time() - max_age
+    keep_mtime = keep.stat().st_mtime
+    for f in directory.glob("essays_*.sqlite3"):
+        if f == keep:
+            continue
+        try:
+            mtime = f.stat().st_mtime
+            if mtime < edge and mtime < keep_mtime:
+                f.unlink()
+        except OSError:
+            pass
+
+
+def get_index(dataset: EssayDataset, persist_dir: str) -> EssayIndex:
+    global _INDEX
+    current = _INDEX
+    if current is not None and current.dataset is dataset:
+        return current
+    with _INDEX_LOCK:
+        if _INDEX is not None and _INDEX.dataset is dataset:
+            return _INDEX
+        path = _index_path(persist_dir, dataset.digest[:16])
+        fresh = not path.exists()
+        index = EssayIndex(dataset, path)
+        if fresh:
+            _cleanup(path.parent, path)
+        # старый индекс не закрываем: его может дочитывать запрос со старым снимком
+        _INDEX = index
+    return index
+
+
+def reset_index() -> None:
+    """Забывает индекс процесса (после fork соединение SQLite родителя использовать нельзя)."""
+    global _INDEX
+    with _INDEX_LOCK:
+        _INDEX = None
@@ -1,6 +1,49 @@
+import asyncio
+import json
+import threading
 import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from typing import Any, Callable, Dict, List, Optional
+
+from .circuit_breaker import CircuitBreaker
+from .deadline import Deadline, DeadlineExceeded, clamp_timeout
+from .retry_policy import RetryPolicy
+from .hedging import Hedger
+from .rate_governor import RateGovernor
+from .llm_cache import LLMCache, CACHE_USE, CACHE_BYPASS, CACHE_MODES
+
+SYSTEM_PROMPT = "Ты строгий оценщик. Отвечай только JSON по схеме."
+
+
+class GigaChatHTTPError(RuntimeError):
+    """Ответ GigaChat с кодом != 200 (status_code и Retry-After доступны для ретраев)."""
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class GigaChatFormatError(RuntimeError):
+    """Ответ 200, но без ожидаемой структуры (choices/message)."""
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Retry-After: либо секунды, либо HTTP-дата
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        dt = parsedate_to_datetime(value)
+        return max(0.0, (dt - datetime.now(timezone.utc)).total_seconds())
+    except Exception:
+        return None
 
 
 class GigaChatClient:
@@ -8,6 +51,7 @@ class GigaChatClient:
     Минимальный клиент GigaChat:
     - берёт access_token по вашему авторизационному токену (client secret / API key)
     - отправляет запрос в chat/completions
+    - держит keep-alive соединения в пуле requests.Session (один клиент на процесс)
     """
 
     def __init__(
@@ -18,6 +62,13 @@ class GigaChatClient:
         base_url: str = "https://gigachat.devices.sberbank.ru/api/v1",
         auth_url: str = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth",
         verify_ssl: bool = False,
+        pool_size: int = 10,
+        governor: Optional[RateGovernor] = None,
+        throttle_retries: int = 3,
+        cache: Optional[LLMCache] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        retry: Optional[RetryPolicy] = None,
+        hedger: Optional[Hedger] = None,
     ):
         self.auth_token = auth_token
         self.scope = scope
@@ -25,75 +76,332 @@ class GigaChatClient:
         self.base_url = base_url
         self.auth_url = auth_url
         self.verify_ssl = verify_ssl
+        self.pool_size = pool_size
+        # все chat_completion процесса проходят через один регулятор нагрузки
+        self.governor = governor or RateGovernor()
+        # повторы по классу ошибки с общим бюджетом (по умолчанию — throttle_retries повторов)
+        self.retry = retry or RetryPolicy(max_retries=throttle_retries)
+        # время ответа (квантили) и дубликаты медленных вызовов (None — без хеджирования)
+        self.hedger = hedger
+        # кеш ответов (None — без кеша)
+        self.cache = cache
+        # предохранитель на время недоступности GigaChat (None — без него)
+        self.breaker = breaker
 
         self._access_token: Optional[str] = None
         self._expires_at: float = 0.0
+        # обновлять токен одновременно может только один поток
+        self._token_lock = threading.Lock()
+
+        self._session = self._make_session(pool_size)
+
+        self._stats_lock = threading.Lock()
+        self._requests_total = 0
+        self._token_refreshes = 0
 
-    def _get_access_token(self) -> str:
-        # кешируем токен
-        now = time.time()
-        if self._access_token and now < self._expires_at - 30:
+    @staticmethod
+    def _make_session(pool_size: int) -> requests.Session:
+        session = requests.Session()
+        # pool_connections — число хостов (oauth + api), pool_maxsize — соединений на хост
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _count(self, field: str) -> None:
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def _token_valid(self, now: float) -> bool:
+        return bool(self._access_token) and now < self._expires_at - 30
+
+    def _get_access_token(self, deadline: Optional[Deadline] = None) -> str:
+        # кешируем токен; быстрый путь без блокировки
+        if self._token_valid(time.time()):
             return self._access_token
 
-        if not self.auth_token:
-            raise RuntimeError("GIGACHAT_TOKEN is not set (env var). Put it into secrets/env.")
+        with self._token_lock:
+            # пока ждали блокировку, токен мог обновить другой поток
+            now = time.time()
+            if self._token_valid(now):
+                return self._access_token
 
-        headers = {
-            "Authorization": f"Basic {self.auth_token}",
-            "RqUID": "00000000-0000-0000-0000-000000000000",
-            "Content-Type": "application/x-www-form-urlencoded",
-            "Accept": "application/json",
-        }
-        data = {"scope": self.scope}
-
-        r = requests.post(
-            self.auth_url,
-            headers=headers,
-            data=data,
-            timeout=self.timeout,
-            verify=self.verify_ssl,
-        )
-        if r.status_code != 200:
-            raise RuntimeError(f"Failed to get access token: {r.status_code} {r.text}")
-
-        payload = r.json()
-        access = payload.get("access_token")
-        expires_in = payload.get("expires_in", 300)
-
-        if not access:
-            raise RuntimeError(f"No access_token in response: {payload}")
-
-        self._access_token = access
-        self._expires_at = now + float(expires_in)
-        return access
-
-    def chat_completion(self, model: str, prompt: str, temperature: float = 0.2, max_tokens: int = 800) -> str:
-        token = self._get_access_token()
-        url = f"{self.base_url}/chat/completions"
+            if not self.auth_token:
+                raise RuntimeError("GIGACHAT_TOKEN is not set (env var). Put it into secrets/env.")
 
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-        }
+            headers = {
+                "Authorization": f"Basic {self.auth_token}",
+                "RqUID": "00000000-0000-0000-0000-000000000000",
+                "Content-Type": "application/x-www-form-urlencoded",
+                "Accept": "application/json",
+            }
+            data = {"scope": self.scope}
+
+            self._count("_requests_total")
+            self._count("_token_refreshes")
+            try:
+                r = self._session.post(
+                    self.auth_url,
+                    headers=headers,
+                    data=data,
+                    # запрос токена тоже укладывается в срок запроса
+                    timeout=clamp_timeout(self.timeout, deadline, "GigaChat token"),
+                    verify=self.verify_ssl,
+                )
+            except requests.Timeout:
+                if deadline is not None and not deadline.allows():
+                    raise DeadlineExceeded("deadline exceeded while waiting for GigaChat token")
+                raise
+            if r.status_code != 200:
+                raise GigaChatHTTPError(
+                    f"Failed to get access token: {r.status_code} {r.text}",
+                    status_code=r.status_code,
+                    retry_after=_parse_retry_after(r.headers.get("Retry-After")),
+                )
+
+            payload = r.json()
+            access = payload.get("access_token")
+            expires_in = payload.get("expires_in", 300)
+
+            if not access:
+                raise RuntimeError(f"No access_token in response: {payload}")
+
+            self._access_token = access
+            self._expires_at = now + float(expires_in)
+            return access
 
+    def _invalidate_token(self, token: Optional[str]) -> None:
+        # 401 на чужом (уже обновлённом другим потоком) токене не сбрасывает свежий
+        with self._token_lock:
+            if self._access_token == token:
+                self._access_token = None
+                self._expires_at = 0.0
+
+    def chat_completion(
+        self,
+        model: str,
+        prompt: str,
+        temperature: float = 0.2,
+        max_tokens: int = 800,
+        cache_mode: str = CACHE_USE,
+        functions: Optional[List[Dict[str, Any]]] = None,
+        function_call: Optional[Any] = None,
+        deadline: Optional[Deadline] = None,
+        hedge: bool = False,
+        cache_if: Optional[Callable[[str], bool]] = None,
+    ) -> str:
+        """
+        cache_mode: "use" — взять из кеша/записать, "refresh" — не читать, но перезаписать,
+        "bypass" — кеш не трогать.
+        functions / function_call — режим function calling GigaChat: если модель вызвала
+        функцию, возвращаются её arguments в виде JSON-строки (вместо message.content).
+        deadline — срок всего запроса: ожидание в очереди, HTTP-таймаут и повторы
+        укладываются в остаток; не успели — DeadlineExceeded (ответ из кеша отдаётся всегда).
+        hedge — если ответа нет дольше обычного (квантиль времени ответа), отправить
+        дубликат и взять первый ответ (см. Hedger; для интерактивных запросов).
+        Время ответа для квантиля копится только по вызовам с hedge=True: починки
+        и пачки с другим max_tokens исказили бы порог.
+        cache_if — проверка ответа: в кеш пишется (и из кеша берётся) только ответ,
+        для которого она вернула True, чтобы невалидный ответ не повторялся из кеша.
+        """
+        if cache_mode not in CACHE_MODES:
+            raise ValueError(f"cache_mode must be one of {CACHE_MODES}")
+
+        cache_key = None
+        if self.cache is not None and cache_mode != CACHE_BYPASS:
+            cache_key = LLMCache.make_key(
+                model, temperature, max_tokens, SYSTEM_PROMPT, prompt,
+                functions=functions, function_call=function_call,
+            )
+            if cache_mode == CACHE_USE:
+                cached = self.cache.get(cache_key)
+                if cached is not None and (cache_if is None or cache_if(cached)):
+                    return cached
+
+        def _remote(on_send: Optional[Callable[[], None]] = None) -> str:
+            return self._chat_completion_remote(
+                model, prompt, temperature, max_tokens, functions, function_call, deadline, on_send,
+                track_latency=hedge,
+            )
+
+        if hedge and self.hedger is not None:
+            content = self.hedger.call(_remote, deadline)
+        else:
+            content = _remote()
+        if cache_key is not None and (cache_if is None or cache_if(content)):
+            self.cache.put(cache_key, content)
+        return content
+
+    def _post_once(
+        self,
+        url: str,
+        headers: Dict,
+        body: Dict,
+        deadline: Optional[Deadline],
+        on_send: Optional[Callable[[], None]] = None,
+        track_latency: bool = False,
+    ):
+        """
+        Один HTTP-вызов через предохранитель и регулятор нагрузки.
+        on_send вызывается прямо перед отправкой (после очереди регулятора);
+        track_latency — учесть время успешного ответа в квантилях хеджа.
+        Возвращает (response, outcome регулятора, retry_after).
+        """
+        # GigaChat недоступен — отказ сразу, без очереди и таймаутов
+        probe = self.breaker.acquire() if self.breaker is not None else False
+        breaker_outcome = "neutral"
+        elapsed = 0.0
+        try:
+            try:
+                self.governor.acquire(timeout=clamp_timeout(self.timeout, deadline, "GigaChat call"))
+            except TimeoutError:
+                if deadline is not None and not deadline.allows():
+                    raise DeadlineExceeded("deadline exceeded while waiting for GigaChat rate limit")
+                raise
+            outcome = "neutral"
+            retry_after = None
+            try:
+                # HTTP-таймаут — не больше остатка срока запроса
+                timeout = clamp_timeout(self.timeout, deadline, "GigaChat call")
+                outcome = "error"
+                self._count("_requests_total")
+                if on_send is not None:
+                    on_send()
+                started = time.monotonic()
+                try:
+                    r = self._session.post(url, headers=headers, json=body, timeout=timeout, verify=self.verify_ssl)
+                except requests.Timeout:
+                    elapsed = time.monotonic() - started
+                    # таймаут, урезанный дедлайном запроса, о здоровье GigaChat ничего не говорит
+                    breaker_outcome = "neutral" if timeout < self.timeout else "error"
+                    if deadline is not None and not deadline.allows():
+                        raise DeadlineExceeded("deadline exceeded while waiting for GigaChat response")
+                    raise
+                except requests.RequestException:
+                    breaker_outcome = "error"
+                    raise
+                elapsed = time.monotonic() - started
+                if r.status_code == 200:
+                    outcome = "ok"
+                    # задержка хеджа считается по одному успешному HTTP-ответу:
+                    # без очереди регулятора, пауз между повторами и получения токена
+                    if track_latency and self.hedger is not None:
+                        self.hedger.latency.observe(elapsed)
+                elif r.status_code == 429:
+                    outcome = "throttled"
+                    retry_after = _parse_retry_after(r.headers.get("Retry-After"))
+                elif r.status_code < 500:
+                    outcome = "neutral"
+                breaker_outcome = outcome if outcome in ("ok", "error") else "neutral"
+            finally:
+                self.governor.release(outcome, retry_after)
+        finally:
+            if self.breaker is not None:
+                self.breaker.record(breaker_outcome, elapsed, probe)
+        return r, outcome, retry_after
+
+    def _chat_completion_remote(
+        self,
+        model: str,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        functions: Optional[List[Dict[str, Any]]] = None,
+        function_call: Optional[Any] = None,
+        deadline: Optional[Deadline] = None,
+        on_send: Optional[Callable[[], None]] = None,
+        track_latency: bool = False,
+    ) -> str:
+        # срок уже вышел — не тратим даже запрос токена
+        clamp_timeout(self.timeout, deadline, "GigaChat call")
+        if self.breaker is not None:
+            self.breaker.check()
+        url = f"{self.base_url}/chat/completions"
         body = {
             "model": model,
             "temperature": temperature,
             "max_tokens": max_tokens,
             "messages": [
-                {"role": "system", "content": "Ты строгий оценщик. Отвечай только JSON по схеме."},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt},
             ],
         }
+        if functions:
+            body["functions"] = functions
+            if function_call is not None:
+                body["function_call"] = function_call
+
+        used_token = [None]
 
-        r = requests.post(url, headers=headers, json=body, timeout=self.timeout, verify=self.verify_ssl)
-        if r.status_code != 200:
-            raise RuntimeError(f"Chat completion failed: {r.status_code} {r.text}")
+        def _send():
+            # токен берём на каждой попытке: после 401 политика сбрасывает его и повторяет
+            token = used_token[0] = self._get_access_token(deadline)
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            }
+            r, _, retry_after = self._post_once(url, headers, body, deadline, on_send, track_latency)
+            if r.status_code != 200:
+                raise GigaChatHTTPError(
+                    f"Chat completion failed: {r.status_code} {r.text}",
+                    status_code=r.status_code,
+                    retry_after=retry_after,
+                )
+            return r
+
+        r = self.retry.call(_send, deadline=deadline, on_auth=lambda: self._invalidate_token(used_token[0]))
 
         data = r.json()
-        # стандартно: choices[0].message.content
+        # стандартно: choices[0].message.content; при function calling — message.function_call.arguments
         try:
-            return data["choices"][0]["message"]["content"]
+            message = data["choices"][0]["message"]
+            fc = message.get("function_call")
+            if fc and fc.get("arguments") is not None:
+                args = fc["arguments"]
+                return args if isinstance(args, str) else json.dumps(args, ensure_ascii=False)
+            return message["content"]
         except Exception:
-            raise RuntimeError(f"Unexpected response format: {data}")
+            raise GigaChatFormatError(f"Unexpected response format: {data}")
+
+    async def achat_completion(self, model: str, prompt: str, **kwargs) -> str:
+        """
+        Асинхронный двойник chat_completion для asyncio-кода (те же параметры).
+        Сам HTTP-вызов выполняется в пуле потоков через общий Session,
+        поэтому пул соединений и OAuth-токен остаются общими с синхронным путём.
+        """
+        return await asyncio.to_thread(self.chat_completion, model, prompt, **kwargs)
+
+    def stats(self) -> Dict:
+        """Счётчики запросов и переиспользования keep-alive соединений."""
+        opened = 0
+        adapter = self._session.get_adapter(self.base_url)
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                opened += getattr(pool, "num_connections", 0)
+
+        with self._stats_lock:
+            total = self._requests_total
+            refreshes = self._token_refreshes
+
+        return {
+            "requests_total": total,
+            "token_refreshes": refreshes,
+            "connections_opened": opened,
+            "connections_reused": max(total - opened, 0),
+            "pool_size": self.pool_size,
+            "governor": self.governor.stats(),
+            "breaker": self.breaker.stats() if self.breaker is not None else None,
+            "retry": self.retry.stats(),
+            "hedge": self.hedger.stats() if self.hedger is not None else None,
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+    def close(self) -> None:
+        if self.hedger is not None:
+            self.hedger.close()
+        self._session.close()
+        if self.cache is not None:
+            self.cache.close()
@@ -0,0 +1,120 @@
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Optional
+
+from .deadline import Deadline
+from .retry_policy import RetryBudget
+
+
+class LatencyTracker:
+    """Последние size длительностей вызовов (секунды) и квантили по ним."""
+
+    def __init__(self, size: int = 500):
+        self._lock = threading.Lock()
+        self._samples: Deque[float] = deque(maxlen=max(1, int(size)))
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class Hedger:
+    """
+    Hedged requests для интерактивных запросов: если вызов не ответил за
+    квантиль quantile наблюдаемого времени HTTP-ответа (не меньше min_delay), отсчитанный
+    от начала отправки (fn получает колбэк on_send и вызывает его перед запросом), запускается
+    дубликат; берётся первый успешный ответ, второй игнорируется (отменяется, если
+    ещё не начался). Дубликатов не больше max_extra_ratio от числа вызовов за window_sec.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.95,
+        min_samples: int = 20,
+        min_delay: float = 1.0,
+        max_extra_ratio: float = 0.1,
+        window_sec: float = 60.0,
+        max_workers: int = 8,
+    ):
+        self.quantile = float(quantile)
+        self.min_samples = int(min_samples)
+        self.min_delay = float(min_delay)
+        self.latency = LatencyTracker()
+        # тот же скользящий бюджет, что и у повторов, без запаса на малом трафике
+        self.budget = RetryBudget(ratio=max_extra_ratio, min_per_sec=0.0, window_sec=window_sec)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gigachat-hedge")
+
+        self._stats_lock = threading.Lock()
+        self._hedged = 0
+        self._hedge_wins = 0
+
+    def delay(self) -> Optional[float]:
+        """Через сколько секунд запускать дубликат; None — мало наблюдений, не хеджируем."""
+        if len(self.latency) < self.min_samples:
+            return None
+        return max(self.min_delay, self.latency.quantile(self.quantile))
+
+    def call(self, fn: Callable[[Optional[Callable[[], None]]], Any], deadline: Optional[Deadline] = None) -> Any:
+        self.budget.record_call()
+        delay = self.delay()
+        if delay is None or (deadline is not None and not deadline.allows(delay + deadline.min_call_sec)):
+            return fn(None)
+
+        sent = threading.Event()
+        first = self._pool.submit(fn, sent.set)
+        # очередь регулятора и получение токена дубликат не ускорит: ждём начала отправки
+        while not sent.wait(timeout=0.05):
+            if first.done():
+                return first.result()
+        done, _ = wait([first], timeout=delay)
+        if done or not self.budget.try_spend():
+            return first.result()
+
+        second = self._pool.submit(fn, None)
+        with self._stats_lock:
+            self._hedged += 1
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    if f is second:
+                        with self._stats_lock:
+                            self._hedge_wins += 1
+                    # проигравший дорабатывает в фоне (HTTP-вызов не прервать), результат отбрасывается
+                    for other in pending:
+                        other.cancel()
+                    return f.result()
+                error = f.exception()
+        raise error
+
+    def stats(self) -> Dict:
+        p50, p90, p95 = (self.latency.quantile(q) for q in (0.5, 0.9, 0.95))
+        delay = self.delay()
+        with self._stats_lock:
+            hedged, wins = self._hedged, self._hedge_wins
+        return {
+            "samples": len(self.latency),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p90_ms": round(p90 * 1000, 1) if p90 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedge_delay_ms": round(delay * 1000, 1) if delay is not None else None,
+            "hedged": hedged,
+            "hedge_wins": wins,
+            "budget": self.budget.stats(),
+        }
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,403 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .schemas import ScoreRequest, validate_score_output
+from .llm_cache import CACHE_USE
+from .circuit_breaker import CircuitOpenError
+
+# Статусы элементов задания
+ITEM_QUEUED = "queued"
+ITEM_RUNNING = "running"
+ITEM_DONE = "done"
+ITEM_ERROR = "error"
+
+
+class JobStore:
+    """
+    Персистентная очередь заданий на оценку в SQLite (WAL, файл в PERSIST_DIR).
+
+    Задание = набор элементов; воркер забирает элемент под «аренду» (lease):
+    если процесс упал/перезапустился, по истечении lease_sec элемент снова
+    становится доступным. После max_attempts таких потерь элемент помечается ошибкой.
+    Файл можно делить между gunicorn-воркерами: захват элемента — в BEGIN IMMEDIATE.
+    """
+
+    def __init__(self, path: str, lease_sec: float = 300, max_attempts: int = 3, ttl_sec: float = 7 * 24 * 3600):
+        self.path = Path(path)
+        self.lease_sec = float(lease_sec)
+        self.max_attempts = int(max_attempts)
+        self.ttl_sec = float(ttl_sec)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # isolation_level=None — транзакциями управляем сами
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                cache_mode TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                essay_id TEXT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL,
+                result TEXT,
+                error TEXT,
+                elapsed_ms REAL,
+                PRIMARY KEY (job_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items(status, lease_until);
+            """
+        )
+
+    def create_job(self, items: List[Dict[str, Any]], cache_mode: str = CACHE_USE) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        rows = [
+            (
+                job_id,
+                i,
+                str(item["essay_id"]) if item.get("essay_id") is not None else None,
+                json.dumps(item, ensure_ascii=False),
+                ITEM_QUEUED,
+            )
+            for i, item in enumerate(items)
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._purge_locked(now)
+                self._conn.execute(
+                    "INSERT INTO jobs (job_id, cache_mode, total, created_at) VALUES (?, ?, ?, ?)",
+                    (job_id, cache_mode, len(items), now),
+                )
+                self._conn.executemany(
+                    "INSERT INTO job_items (job_id, idx, essay_id, payload, status) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def _purge_locked(self, now: float) -> None:
+        # старые завершённые задания удаляем, чтобы файл не рос бесконечно
+        old = [r[0] for r in self._conn.execute(
+            "SELECT job_id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (now - self.ttl_sec,)
+        )]
+        for job_id in old:
+            self._conn.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def claim(self) -> Optional[Tuple[str, int, Dict[str, Any], str]]:
+        """
+        Забирает следующий элемент (FIFO по заданиям) под аренду.
+        Возвращает (job_id, idx, item, cache_mode) или None, если очередь пуста.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # элементы, «потерянные» упавшим воркером слишком много раз, — в ошибку
+                lost = self._conn.execute(
+                    "SELECT job_id, idx FROM job_items WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                    (ITEM_RUNNING, now, self.max_attempts),
+                ).fetchall()
+                for job_id, idx in lost:
+                    self._finish_locked(
+                        job_id, idx, ITEM_ERROR, None,
+                        f"worker lost the item {self.max_attempts} times (lease expired)", None, now,
+                    )
+
+                row = self._conn.execute(
+                    """
+                    SELECT i.job_id, i.idx, i.payload, j.cache_mode
+                    FROM job_items i JOIN jobs j ON j.job_id = i.job_id
+                    WHERE i.status = ? OR (i.status = ? AND i.lease_until < ?)
+                    ORDER BY j.created_at, i.idx
+                    LIMIT 1
+                    """,
+                    (ITEM_QUEUED, ITEM_RUNNING, now),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                job_id, idx, payload, cache_mode = row
+                self._conn.execute(
+                    "UPDATE job_items SET status = ?, attempts = attempts + 1, lease_until = ? WHERE job_id = ? AND idx = ?",
+                    (ITEM_RUNNING, now + self.lease_sec, job_id, idx),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id, idx, json.loads(payload), cache_mode
+
+    def complete(
+        self,
+        job_id: str,
+        idx: int,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None,
+        elapsed_ms: Optional[float] = None,
+    ) -> None:
+        status = ITEM_ERROR if error is not None else ITEM_DONE
+        payload = json.dumps(result, ensure_ascii=False) if result is not None else None
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._finish_locked(job_id, idx, status, payload, error, elapsed_ms, time.time())
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def renew(self, job_id: str, idx: int) -> None:
+        """Продлевает аренду элемента, который ещё оценивается (heartbeat воркера)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE job_items SET lease_until = ? WHERE job_id = ? AND idx = ? AND status = ?",
+                    (time.time() + self.lease_sec, job_id, idx, ITEM_RUNNING),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def defer(self, job_id: str, idx: int, delay: float) -> None:
+        """
+        Возвращает элемент в очередь через delay секунд, не расходуя попытку
+        (GigaChat недоступен — элемент тут ни при чём).
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # остаётся running с короткой арендой: по её истечении claim заберёт элемент снова
+                self._conn.execute(
+                    "UPDATE job_items SET attempts = MAX(attempts - 1, 0), lease_until = ? "
+                    "WHERE job_id = ? AND idx = ? AND status = ?",
+                    (time.time() + delay, job_id, idx, ITEM_RUNNING),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _finish_locked(self, job_id, idx, status, result, error, elapsed_ms, now) -> None:
+        self._conn.execute(
+            # только running: завершённый элемент не перезаписывается вторым исполнителем
+            "UPDATE job_items SET status = ?, result = ?, error = ?, elapsed_ms = ?, lease_until = NULL "
+            "WHERE job_id = ? AND idx = ? AND status = ?",
+            (status, result, error, elapsed_ms, job_id, idx, ITEM_RUNNING),
+        )
+        pending = self._conn.execute(
+            "SELECT COUNT(*) FROM job_items WHERE job_id = ? AND status IN (?, ?)",
+            (job_id, ITEM_QUEUED, ITEM_RUNNING),
+        ).fetchone()[0]
+        if pending == 0:
+            self._conn.execute(
+                "UPDATE jobs SET finished_at = ? WHERE job_id = ? AND finished_at IS NULL", (now, job_id)
+            )
+
+    def get_job(self, job_id: str, include_results: bool = True) -> Optional[Dict[str, Any]]:
+        """Прогресс задания и (частичные) результаты в порядке items; None — нет такого задания."""
+        with self._lock:
+            job = self._conn.execute(
+                "SELECT cache_mode, total, created_at, finished_at FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT idx, essay_id, status, result, error, elapsed_ms FROM job_items WHERE job_id = ? ORDER BY idx",
+                (job_id,),
+            ).fetchall()
+
+        cache_mode, total, created_at, finished_at = job
+        counts = {ITEM_QUEUED: 0, ITEM_RUNNING: 0, ITEM_DONE: 0, ITEM_ERROR: 0}
+        results, errors, timings = [], [], []
+        for idx, essay_id, status, result, error, elapsed_ms in rows:
+            counts[status] += 1
+            if status == ITEM_DONE:
+                if include_results:
+                    results.append(json.loads(result))
+            elif status == ITEM_ERROR:
+                errors.append({"essay_id": essay_id, "error": error})
+            if elapsed_ms is not None:
+                timings.append({"index": idx, "essay_id": essay_id, "ok": status == ITEM_DONE, "elapsed_ms": elapsed_ms})
+
+        finished = counts[ITEM_DONE] + counts[ITEM_ERROR]
+        if finished_at is not None:
+            status = "done"
+        elif finished or counts[ITEM_RUNNING]:
+            status = "running"
+        else:
+            status = "queued"
+
+        out = {
+            "job_id": job_id,
+            "status": status,
+            "total": total,
+            "done": counts[ITEM_DONE],
+            "failed": counts[ITEM_ERROR],
+            "running": counts[ITEM_RUNNING],
+            "queued": counts[ITEM_QUEUED],
+            "progress": round(finished / total, 4) if total else 1.0,
+            "cache_mode": cache_mode,
+            "created_at": created_at,
+            "finished_at": finished_at,
+            "errors": errors,
+            "timings": timings,
+        }
+        if include_results:
+            out["results"] = results
+        return out
+
+    def stats(self) -> Dict:
+        with self._lock:
+            by_status = dict(self._conn.execute("SELECT status, COUNT(*) FROM job_items GROUP BY status").fetchall())
+            jobs_total, jobs_active = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(finished_at IS NULL), 0) FROM jobs"
+            ).fetchone()
+        return {"path": str(self.path), "jobs": jobs_total, "jobs_active": jobs_active, "items": by_status}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# Одно хранилище и один набор фоновых воркеров на процесс
+_STORE: Optional[JobStore] = None
+_STORE_LOCK = threading.Lock()
+_WORKERS: List[threading.Thread] = []
+_STOP = threading.Event()
+
+
+def get_store(config) -> JobStore:
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = JobStore(
+                    config["JOBS_DB_PATH"],
+                    lease_sec=config.get("JOB_LEASE_SEC", 300),
+                    max_attempts=config.get("JOB_MAX_ATTEMPTS", 3),
+                    ttl_sec=config.get("JOB_TTL_SEC", 7 * 24 * 3600),
+                )
+    return _STORE
+
+
+def _process(store: JobStore, job_id: str, idx: int, item: Dict[str, Any], cache_mode: str) -> float:
+    """Оценивает элемент; возвращает паузу перед следующим claim (0 — сразу)."""
+    from .scoring import score_essay
+
+    started = time.perf_counter()
+    # пока элемент оценивается (повторы, починки — дольше lease_sec), аренда продлевается:
+    # иначе другой воркер забрал бы его и оценил второй раз
+    done = threading.Event()
+
+    def _heartbeat() -> None:
+        while not done.wait(store.lease_sec / 3):
+            try:
+                store.renew(job_id, idx)
+            except sqlite3.Error:
+                pass
+
+    heartbeat = threading.Thread(target=_heartbeat, name="jobs-lease", daemon=True)
+    heartbeat.start()
+    retry_after = None
+    try:
+        out = score_essay(ScoreRequest.from_json(item), cache_mode=cache_mode)
+        validate_score_output(out)
+        result, error = out, None
+    except CircuitOpenError as e:
+        retry_after = e.retry_after
+    except Exception as e:
+        result, error = None, str(e)
+    finally:
+        # heartbeat останавливаем до defer/complete: его renew, начатый раньше,
+        # не должен перезаписать короткую аренду defer
+        done.set()
+        heartbeat.join()
+    if retry_after is not None:
+        # GigaChat недоступен: элемент ждёт в очереди, воркер не перебирает очередь вхолостую
+        store.defer(job_id, idx, retry_after)
+        return retry_after
+    store.complete(job_id, idx, result=result, error=error, elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+    return 0.0
+
+
+def _worker_loop(app, poll_sec: float) -> None:
+    with app.app_context():
+        store = get_store(app.config)
+        while not _STOP.is_set():
+            try:
+                claimed = store.claim()
+            except sqlite3.Error as e:
+                app.logger.warning("jobs: claim failed: %s", e)
+                claimed = None
+            if claimed is None:
+                _STOP.wait(poll_sec)
+                continue
+            try:
+                pause = _process(store, *claimed)
+                if pause:
+                    _STOP.wait(pause)
+            except Exception:
+                # элемент останется running и вернётся в очередь по истечении lease
+                app.logger.exception("jobs: failed to store result for %s[%s]", claimed[0], claimed[1])
+
+
+def start_workers(app) -> int:
+    """
+    Запускает JOB_WORKERS фоновых потоков, разбирающих очередь заданий (один раз на процесс).
+    Возвращает число запущенных потоков. Незавершённые после рестарта элементы
+    подхватываются автоматически (по истечении lease).
+    """
+    n = int(app.config.get("JOB_WORKERS", 2))
+    with _STORE_LOCK:
+        if _WORKERS or n <= 0:
+            return 0
+        _STOP.clear()
+        poll_sec = float(app.config.get("JOB_POLL_SEC", 1.0))
+        for i in range(n):
+            t = threading.Thread(target=_worker_loop, args=(app, poll_sec), name=f"job-worker-{i}", daemon=True)
+            t.start()
+            _WORKERS.append(t)
+    return n
+
+
+def stop_workers(timeout: float = 5.0) -> None:
+    """Останавливает фоновые потоки (текущий элемент дорабатывается) и закрывает хранилище."""
+    global _STORE
+    _STOP.set()
+    for t in list(_WORKERS):
+        t.join(timeout)
+    with _STORE_LOCK:
+        alive = any(t.is_alive() for t in _WORKERS)
+        _WORKERS.clear()
+        # поток, не успевший дописать результат, ещё держит хранилище — его не закрываем
+        if _STORE is not None and not alive:
+            _STORE.close()
+            _STORE = None
+
+
+def jobs_stats() -> Dict:
+    return {"workers": len(_WORKERS), **(_STORE.stats() if _STORE is not None else {})}
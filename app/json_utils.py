@@ -13,53 +13,349 @@ def _try_load(candidate: str) -> dict:
     return json.loads(candidate)
 
 
+def _balanced_spans(text: str, string_aware: bool = True):
+    """
+    Один проход по тексту: возвращает список (start, end) всех сбалансированных
+    {...} в порядке закрытия. Внутри объекта учитываются строки в двойных кавычках
+    и экранирование (фигурные скобки внутри строк не считаются).
+    Вне объектов кавычки игнорируются — это обычный текст ответа.
+    """
+    spans = []
+    stack = []
+    in_str = False
+    esc = False
+    for i, ch in enumerate(text):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch == "{":
+            stack.append(i)
+        elif ch == "}":
+            if stack:
+                spans.append((stack.pop(), i + 1))
+        elif ch == '"' and string_aware and stack:
+            in_str = True
+    return spans
+
+
+def _top_level(spans):
+    # spans идут в порядке закрытия: родитель закрывается после детей,
+    # поэтому вложенные объекты просто снимаем со стека — O(n) в сумме
+    top = []
+    for start, end in spans:
+        while top and top[-1][0] > start:
+            top.pop()
+        top.append((start, end))
+    return top
+
+
+def iter_json_objects(text: str, string_aware: bool = True):
+    """Сбалансированные {...} верхнего уровня в порядке появления (линейное время и память)."""
+    for start, end in _top_level(_balanced_spans(text, string_aware)):
+        yield text[start:end]
+
+
 def extract_json(text: str) -> dict:
     """
     Устойчивый извлекатель JSON из ответа модели:
-    - нормализует кавычки
-    - пытается json.loads целиком
-    - если не вышло: ищет JSON-объекты по { ... } и пытается распарсить каждый
-      (берём самый длинный валидный объект)
+    - пытается json.loads целиком (как есть и с нормализованными кавычками)
+    - если не вышло: однопроходным сканером находит сбалансированные { ... }
+      и пробует распарсить (сначала объекты верхнего уровня, от длинных к коротким,
+      затем вложенные; затем то же без учёта строк)
     """
     if text is None:
         raise ValueError("Empty text")
 
-    text = _normalize_quotes(text.strip())
+    text = text.strip()
+
+    # 1) напрямую («ёлочки» внутри строк валидны, поэтому сначала без нормализации)
+    try:
+        obj = _try_load(text)
+        if isinstance(obj, dict):
+            return obj
+    except Exception:
+        pass
 
-    # 1) напрямую
+    text = _normalize_quotes(text)
     try:
-        return _try_load(text)
+        obj = _try_load(text)
+        if isinstance(obj, dict):
+            return obj
     except Exception:
         pass
 
-    # 2) поиск всех кандидатов { ... } (не только от первой до последней)
-    # Берём все подстроки, которые начинаются с { и заканчиваются на }
-    # Попытаемся распарсить каждую, начиная с самых длинных
-    candidates = []
+    # 2) кандидаты { ... } из линейного сканера
+    last_err = None
+    tried = set()
+    for string_aware in (True, False):
+        spans = _balanced_spans(text, string_aware)
+        top = _top_level(spans)
+        nested = sorted(set(spans) - set(top), key=lambda p: p[1] - p[0], reverse=True)
+        ordered = sorted(top, key=lambda p: p[1] - p[0], reverse=True) + nested
 
-    starts = [m.start() for m in re.finditer(r"\{", text)]
-    ends = [m.start() for m in re.finditer(r"\}", text)]
+        for start, end in ordered[:50]:
+            if (start, end) in tried:
+                continue
+            tried.add((start, end))
+            cand = text[start:end]
+            if "```" in cand:
+                # иногда модель вставляет куски markdown-блоков прямо в JSON
+                cand = cand.replace("```json", "").replace("```", "")
+            try:
+                obj = _try_load(cand)
+                if isinstance(obj, dict):
+                    return obj
+            except Exception as e:
+                last_err = e
 
-    for i in starts:
-        for j in ends:
-            if j > i:
-                candidates.append(text[i:j+1])
+    raise ValueError(f"Could not extract valid JSON. Last error: {last_err}")
 
-    # сортируем по длине (длиннее — вероятнее полный JSON)
-    candidates.sort(key=len, reverse=True)
 
-    last_err = None
-    for cand in candidates[:50]:  # ограничим, чтобы не было квадратичной боли
-        cand2 = cand.strip()
+def extract_json_objects(text: str) -> list:
+    """
+    Все JSON-объекты из ответа с несколькими результатами (пакетная оценка):
+    массив целиком, объект с массивом внутри или объекты подряд.
+    Битые объекты пробуем починить локально (repair_json), неисправимые пропускаем.
+    """
+    if text is None:
+        raise ValueError("Empty text")
 
-        # иногда модель оборачивает JSON в тройные кавычки/код-блоки — чистим слегка
-        cand2 = cand2.replace("```json", "").replace("```", "").strip()
+    text = text.strip()
+    try:
+        obj = json.loads(text)
+    except Exception:
+        obj = None
 
+    if isinstance(obj, list):
+        return [o for o in obj if isinstance(o, dict)]
+    if isinstance(obj, dict):
+        for v in obj.values():
+            if isinstance(v, list) and v and all(isinstance(o, dict) for o in v):
+                return v
+        return [obj]
+
+    out = []
+    for cand in iter_json_objects(text):
         try:
-            obj = _try_load(cand2)
-            if isinstance(obj, dict):
-                return obj
+            o = json.loads(cand)
+        except Exception:
+            try:
+                o, _ = repair_json(cand)
+            except ValueError:
+                continue
+        if isinstance(o, dict):
+            out.append(o)
+    return out
+
+
+# -------------------------
+# Локальная (детерминированная) починка JSON — до того, как тратить LLM-вызовы
+# -------------------------
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)\s*(?:```|$)", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_UNQUOTED_KEY_RE = re.compile(r"([{,]\s*)([A-Za-zА-Яа-яЁё_][\wА-Яа-яЁё ]*?)\s*:")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_PY_LITERAL_RE = re.compile(r"\b(True|False|None)\b")
+_CYR_KEY_RE = re.compile(r"^[Кк](?=[1-4])")
+
+
+def _split_strings(s: str):
+    """
+    Делит текст на сегменты (is_string, chunk) по строкам в двойных кавычках
+    (с учётом экранирования). Незакрытая строка в конце считается строкой.
+    """
+    out = []
+    i, n, start = 0, len(s), 0
+    while i < n:
+        if s[i] == '"':
+            if i > start:
+                out.append((False, s[start:i]))
+            j = i + 1
+            while j < n:
+                if s[j] == "\\":
+                    j += 2
+                    continue
+                if s[j] == '"':
+                    break
+                j += 1
+            out.append((True, s[i:j + 1]))
+            i = start = j + 1
+        else:
+            i += 1
+    if start < n:
+        out.append((False, s[start:]))
+    return out
+
+
+def _outside_strings(s: str, fn) -> str:
+    return "".join(chunk if is_str else fn(chunk) for is_str, chunk in _split_strings(s))
+
+
+def _fix_code_fence(s: str) -> str:
+    m = _FENCE_RE.search(s)
+    return m.group(1) if m else s
+
+
+def _fix_slice_object(s: str) -> str:
+    # отрезаем текст до первой { и после последней } (если } нет — ответ, вероятно, обрезан)
+    start = s.find("{")
+    if start < 0:
+        return s
+    end = s.rfind("}")
+    return s[start:end + 1] if end > start else s[start:]
+
+
+def _fix_smart_quotes(s: str) -> str:
+    # только “ ” „ — ими модель иногда заменяет кавычки JSON;
+    # «ёлочки» и ’ встречаются в тексте объяснений, их не трогаем
+    return s.replace("“", '"').replace("”", '"').replace("„", '"')
+
+
+def _fix_single_quotes(s: str) -> str:
+    # 'строка' -> "строка" вне двойных кавычек; апострофы внутри слов не трогаем
+    res = []
+    for is_str, chunk in _split_strings(s):
+        if is_str:
+            res.append(chunk)
+            continue
+        i, n = 0, len(chunk)
+        buf = []
+        while i < n:
+            ch = chunk[i]
+            prev = chunk[i - 1] if i > 0 else ""
+            if ch == "'" and not prev.isalnum():
+                j = i + 1
+                while j < n and not (chunk[j] == "'" and chunk[j - 1] != "\\"):
+                    j += 1
+                if j < n:
+                    inner = chunk[i + 1:j].replace("\\'", "'")
+                    buf.append(json.dumps(inner, ensure_ascii=False))
+                    i = j + 1
+                    continue
+            buf.append(ch)
+            i += 1
+        res.append("".join(buf))
+    return "".join(res)
+
+
+def _fix_unquoted_keys(s: str) -> str:
+    return _outside_strings(s, lambda c: _UNQUOTED_KEY_RE.sub(lambda m: f'{m.group(1)}"{m.group(2).strip()}":', c))
+
+
+def _fix_trailing_commas(s: str) -> str:
+    return _outside_strings(s, lambda c: _TRAILING_COMMA_RE.sub(r"\1", c))
+
+
+def _fix_python_literals(s: str) -> str:
+    return _outside_strings(s, lambda c: _PY_LITERAL_RE.sub(lambda m: _PY_LITERALS[m.group(1)], c))
+
+
+def _fix_truncated(s: str) -> str:
+    """
+    Дописывает закрывающие скобки для ответа, обрезанного по max_tokens.
+    Оборванную строку не закрываем, а отбрасываем вместе с её ключом: обрезанное
+    объяснение не должно сойти за полное — недостающее поле дозапросит salvage.
+    """
+    stack = []
+    in_str = False
+    str_start = 0
+    esc = False
+    for i, ch in enumerate(s):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch == '"':
+            in_str = True
+            str_start = i
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+
+    if not stack and not in_str:
+        return s
+
+    out = s[:str_start] if in_str else s
+    # висящий ключ без значения (, "K4": или , "K4") и висящая запятая
+    out = re.sub(r',?\s*"[^"]*"\s*:\s*$', "", out.rstrip())
+    out = re.sub(r',\s*"[^"]*"$', "", out)
+    out = out.rstrip().rstrip(",")
+    return out + "".join(reversed(stack))
+
+
+# Порядок важен: от самых безопасных правок к самым «смелым»
+_LOCAL_FIXES = [
+    ("code_fence", _fix_code_fence),
+    ("slice_object", _fix_slice_object),
+    ("smart_quotes", _fix_smart_quotes),
+    ("python_literals", _fix_python_literals),
+    ("single_quotes", _fix_single_quotes),
+    ("unquoted_keys", _fix_unquoted_keys),
+    ("trailing_commas", _fix_trailing_commas),
+    ("truncated", _fix_truncated),
+]
+
+
+def _fix_cyrillic_keys(obj: dict):
+    fixed = {}
+    changed = False
+    for k, v in obj.items():
+        nk = _CYR_KEY_RE.sub("K", k) if isinstance(k, str) else k
+        changed = changed or nk != k
+        fixed[nk] = v
+    return fixed, changed
+
+
+def repair_json(text: str):
+    """
+    Локальная починка ответа модели без LLM.
+    Последовательно применяет правки из _LOCAL_FIXES и после каждой изменившей текст
+    пробует json.loads. Возвращает (dict, список применённых правок).
+    Бросает ValueError, если починить не удалось.
+    """
+    if text is None:
+        raise ValueError("Empty text")
+
+    s = text.strip()
+    applied = []
+
+    def _finish(obj):
+        obj, changed = _fix_cyrillic_keys(obj)
+        if changed:
+            applied.append("cyrillic_keys")
+        return obj, applied
+
+    try:
+        obj = json.loads(s)
+        if isinstance(obj, dict):
+            return _finish(obj)
+    except Exception:
+        pass
+
+    last_err = None
+    for name, fix in _LOCAL_FIXES:
+        fixed = fix(s)
+        if fixed == s:
+            continue
+        s = fixed
+        applied.append(name)
+        try:
+            obj = json.loads(s)
         except Exception as e:
             last_err = e
+            continue
+        if isinstance(obj, dict):
+            return _finish(obj)
 
-    raise ValueError(f"Could not extract valid JSON. Last error: {last_err}")
+    raise ValueError(f"Local JSON repair failed after {applied}. Last error: {last_err}")
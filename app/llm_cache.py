@@ -0,0 +1,165 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+# Режимы работы с кешем для одного вызова
+CACHE_USE = "use"          # читать и писать
+CACHE_REFRESH = "refresh"  # не читать, но перезаписать свежим ответом
+CACHE_BYPASS = "bypass"    # не читать и не писать
+CACHE_MODES = (CACHE_USE, CACHE_REFRESH, CACHE_BYPASS)
+
+
+class LLMCache:
+    """
+    Персистентный кеш ответов LLM в SQLite (content-addressed).
+    Ключ — sha256 от (model, temperature, max_tokens, system, prompt, ...).
+    Вытеснение: TTL + LRU по числу записей и суммарному размеру.
+    Файл можно делить между gunicorn-воркерами (WAL).
+    """
+
+    _EVICT_EVERY = 50  # проверять лимиты раз в N записей
+    # last_access обновляем не чаще раза в N секунд на запись: попадание в кеш обычно без записи,
+    # а для LRU такой точности хватает
+    _TOUCH_EVERY_SEC = 60.0
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 20000,
+        max_bytes: int = 200 * 1024 * 1024,
+        ttl_sec: float = 30 * 24 * 3600,
+    ):
+        self.path = Path(path)
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.ttl_sec = float(ttl_sec)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+        self._conn.commit()
+
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._evicted = 0
+
+    @staticmethod
+    def make_key(model: str, temperature: float, max_tokens: int, system: str, prompt: str, **extra) -> str:
+        payload = {
+            "model": model,
+            "temperature": float(temperature),
+            "max_tokens": int(max_tokens),
+            "system": system,
+            "prompt": prompt,
+        }
+        # дополнительные параметры запроса (например, functions) тоже влияют на ответ
+        payload.update({k: v for k, v in extra.items() if v is not None})
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at, last_access FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._misses += 1
+                return None
+            value, created_at, last_access = row
+            if now - created_at > self.ttl_sec:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self._misses += 1
+                self._evicted += 1
+                return None
+            if now - last_access > self._TOUCH_EVERY_SEC:
+                self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            self._hits += 1
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self._conn.commit()
+            self._writes += 1
+            if self._writes % self._EVICT_EVERY == 0:
+                self._evict_locked(now)
+
+    def evict(self) -> int:
+        """Принудительное вытеснение (TTL + LRU). Возвращает число удалённых записей."""
+        with self._lock:
+            return self._evict_locked(time.time())
+
+    def _evict_locked(self, now: float) -> int:
+        removed = self._conn.execute(
+            "DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_sec,)
+        ).rowcount
+
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if count > self.max_entries or total > self.max_bytes:
+            # удаляем самые давно использованные, пока не влезем в лимиты
+            rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC").fetchall()
+            drop = []
+            for key, size in rows:
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                drop.append((key,))
+                count -= 1
+                total -= size
+            self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", drop)
+            removed += len(drop)
+
+        self._conn.commit()
+        self._evicted += removed
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+            lookups = self._hits + self._misses
+            return {
+                "path": str(self.path),
+                "entries": count,
+                "bytes": total,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "writes": self._writes,
+                "evicted": self._evicted,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,21 +1,31 @@
+import math
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
 from .schemas import ScoreRequest
 
-PROMPT_VERSION = "v1.1"
+PROMPT_VERSION = "v1.2"
 
-def build_prompt(req: ScoreRequest) -> str:
-    return f"""
+# Секции промпта вынесены в константы, чтобы переиспользовать их
+# (версии шаблонов, пакетная оценка); v1.1 собирается в тот же текст, что и раньше.
+
+_INTRO = """
 Ты — эксперт по проверке сочинений ОГЭ по русскому языку.
 Оцени сочинение по критериям K1–K4 строго по заданным шкалам ниже.
 
 Ключевая цель: максимально точная и стабильная оценка по критериям.
 Не угадывай: если признак не найден явно — снижай балл.
+""".strip()
 
+_FORMAT = """
 ФОРМАТ:
 - Верни ТОЛЬКО валидный JSON.
 - Без markdown, без комментариев вне JSON.
 - Ключи строго: K1, K1_explanation, K2, K2_explanation, K3, K3_explanation, K4, K4_explanation.
 - Значения K1..K4 — целые числа в допустимых диапазонах.
+""".strip()
 
+_CHECKLIST = """
 ПЕРЕД ОЦЕНКОЙ (мысленно, но строго):
 1) Определи: есть ли позиция/ответ на вопрос (для K1).
 2) Найди примеры/аргументы (для K2):
@@ -28,22 +38,17 @@ def build_prompt(req: ScoreRequest) -> str:
 - Для K1: нет ясного ответа/позиции → 0.
 - Для K2: нет нужного количества примеров ИЛИ нет пояснения → снижать.
 - Для K4: нет вывода/структура нарушена → 0.
+""".strip()
 
-ВХОДНЫЕ ДАННЫЕ:
-essay_type: {req.essay_type}
-task_text:
-{req.task_text}
-
-reference_text_essay:
-{req.reference_text_essay}
-
-essay_text:
-{req.essay_text}
-
+_CRITERIA_HEADER = """
 ========================================
 КРИТЕРИИ (используй ТОЛЬКО для данного essay_type)
 ========================================
+""".strip()
 
+# Шкалы K1–K4 по типам сочинений
+RUBRICS = {
+    1: """
 ЕСЛИ essay_type = 1 (языкознательное сочинение):
 
 K1 (0–1). Обоснованный ответ на лингвистический вопрос.
@@ -65,9 +70,8 @@ K3 (0–2). Логичность и связность.
 K4 (0–1). Композиционная стройность.
 1 — есть вступление + основная часть + вывод.
 0 — нет вывода или структура явно нарушена.
-
-----------------------------------------
-
+""".strip(),
+    2: """
 ЕСЛИ essay_type = 2 (литературно-тематическое сочинение):
 
 K1 (0–1). Понимание смысла фрагмента.
@@ -89,9 +93,8 @@ K3 (0–2). Логичность и связность.
 K4 (0–1). Композиционная стройность.
 1 — есть вступление + основная часть + вывод.
 0 — нет вывода или структура нарушена.
-
-----------------------------------------
-
+""".strip(),
+    3: """
 ЕСЛИ essay_type = 3 (морально-нравственное рассуждение):
 
 K1 (0–1). Ответ на нравственный вопрос.
@@ -115,13 +118,223 @@ K3 (0–2). Логичность и связность.
 K4 (0–1). Композиционная стройность.
 1 — есть вступление (позиция) + основная часть (аргументы) + вывод.
 0 — нет вывода или структура нарушена.
+""".strip(),
+}
+
+_RUBRIC_SEPARATOR = "\n\n----------------------------------------\n\n"
 
+_EXPLANATION_RULES = """
 ========================================
 ТРЕБОВАНИЯ К ОБЪЯСНЕНИЯМ:
 - 2–4 предложения, строго по делу.
 - Для K2 обязательно укажи: сколько найдено примеров и какого типа (для essay_type=3).
 - Для K4 укажи, есть ли вывод (да/нет).
 - Если снижаешь балл: кратко напиши, чего именно не хватило.
+""".strip()
+
+
+def _all_rubrics() -> str:
+    return _RUBRIC_SEPARATOR.join(RUBRICS[t] for t in sorted(RUBRICS))
+
+
+# -------------------------
+# Компилятор промптов: версии шаблонов, оценка токенов, бюджет на вход
+# -------------------------
+
+# Версии шаблонов:
+# v1.1 — исходный промпт, шкалы для всех трёх типов сочинений
+# v1.2 — тот же текст, но только шкала для essay_type запроса (~2/3 шкал не отправляются)
+PROMPT_VERSIONS = {
+    "v1.1": {"rubrics": "all"},
+    "v1.2": {"rubrics": "per_type"},
+}
+
+_CRITERIA_HEADER_ONE = """
+========================================
+КРИТЕРИИ (для данного essay_type)
+========================================
+""".strip()
+
+# Грубая оценка для русского текста у GigaChat: ~3 символа на токен
+CHARS_PER_TOKEN = 3.0
+# Меньше этого опорный текст не урезаем — лучше честно отказать
+MIN_REFERENCE_TOKENS = 200
+
+
+class PromptBudgetError(ValueError):
+    """Промпт не помещается в бюджет входных токенов даже после урезания опорного текста."""
+
+
+def estimate_tokens(text: str) -> int:
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+
+def _rubric_block(version: str, essay_type: int) -> str:
+    if version not in PROMPT_VERSIONS:
+        raise ValueError(f"Unknown prompt version: {version}. Known: {sorted(PROMPT_VERSIONS)}")
+    if PROMPT_VERSIONS[version]["rubrics"] == "all":
+        return f"{_CRITERIA_HEADER}\n\n{_all_rubrics()}"
+    if essay_type not in RUBRICS:
+        raise ValueError(f"No rubric for essay_type={essay_type}")
+    return f"{_CRITERIA_HEADER_ONE}\n\n{RUBRICS[essay_type]}"
+
+
+@dataclass(frozen=True)
+class _Template:
+    head: str
+    tail: str
+    head_tokens: int
+    tail_tokens: int
+
+
+_LABEL_REFERENCE = "\n\nreference_text_essay:\n"
+_LABEL_ESSAY = "\n\nessay_text:\n"
+_LABELS_TOKENS = estimate_tokens(_LABEL_REFERENCE + _LABEL_ESSAY)
+
+
+def _make_template(version: str, essay_type: int) -> _Template:
+    head = f"{_INTRO}\n\n{_FORMAT}\n\n{_CHECKLIST}\n\nВХОДНЫЕ ДАННЫЕ:\nessay_type: {essay_type}\ntask_text:\n"
+    tail = f"\n\n{_rubric_block(version, essay_type)}\n\n{_EXPLANATION_RULES}\n\nВерни JSON."
+    return _Template(head, tail, estimate_tokens(head), estimate_tokens(tail))
+
+
+# Статические части шаблонов собираются один раз при импорте
+_TEMPLATES: Dict[Tuple[str, int], _Template] = {
+    (v, t): _make_template(v, t) for v in PROMPT_VERSIONS for t in RUBRICS
+}
+
+
+def _template(version: str, essay_type: int) -> _Template:
+    tpl = _TEMPLATES.get((version, essay_type))
+    if tpl is None:
+        # неизвестный тип/версия — собираем на лету (или получаем понятную ошибку)
+        tpl = _make_template(version, essay_type)
+    return tpl
+
+
+@dataclass
+class CompiledPrompt:
+    text: str
+    version: str
+    # оценка токенов по секциям: instructions / rubric / task_text / reference_text_essay / essay_text
+    sections: Dict[str, int] = field(default_factory=dict)
+    truncated: List[str] = field(default_factory=list)
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.sections.values())
+
+
+def compile_prompt(req: ScoreRequest, version: str = PROMPT_VERSION, budget: int = 0) -> CompiledPrompt:
+    """
+    Собирает промпт по версии шаблона и оценивает размер секций.
+    budget > 0 — лимит входных токенов: при превышении урезается опорный текст,
+    если и этого мало — PromptBudgetError.
+    """
+    tpl = _template(version, req.essay_type)
+    reference = req.reference_text_essay
+    sections = {
+        "instructions": tpl.head_tokens + _LABELS_TOKENS,
+        "rubric": tpl.tail_tokens,
+        "task_text": estimate_tokens(req.task_text),
+        "reference_text_essay": estimate_tokens(reference),
+        "essay_text": estimate_tokens(req.essay_text),
+    }
+    truncated = []
+
+    total = sum(sections.values())
+    if budget and total > budget:
+        allowed = budget - (total - sections["reference_text_essay"])
+        if allowed < MIN_REFERENCE_TOKENS:
+            raise PromptBudgetError(
+                f"Prompt needs ~{total} tokens, budget is {budget} "
+                f"(essay_text ~{sections['essay_text']}, reference_text_essay ~{sections['reference_text_essay']})"
+            )
+        reference = reference[: int(allowed * CHARS_PER_TOKEN) - 3].rstrip() + " […]"
+        sections["reference_text_essay"] = estimate_tokens(reference)
+        truncated.append("reference_text_essay")
+
+    text = (
+        tpl.head + req.task_text
+        + _LABEL_REFERENCE + reference
+        + _LABEL_ESSAY + req.essay_text
+        + tpl.tail
+    ).strip()
+    return CompiledPrompt(text=text, version=version, sections=sections, truncated=truncated)
+
+
+def build_prompt(req: ScoreRequest, version: str = PROMPT_VERSION) -> str:
+    return compile_prompt(req, version).text
+
+
+def prompt_size_report(reqs: Iterable[ScoreRequest], versions: Optional[List[str]] = None) -> Dict[str, Dict]:
+    """Средний/максимальный размер промпта (в оценочных токенах) по версиям шаблонов и секциям."""
+    reqs = list(reqs)
+    report = {}
+    for version in versions or sorted(PROMPT_VERSIONS):
+        totals = []
+        per_section: Dict[str, int] = {}
+        for req in reqs:
+            compiled = compile_prompt(req, version)
+            totals.append(compiled.total_tokens)
+            for name, n in compiled.sections.items():
+                per_section[name] = per_section.get(name, 0) + n
+        count = len(totals) or 1
+        report[version] = {
+            "prompts": len(totals),
+            "avg_tokens": round(sum(totals) / count, 1),
+            "max_tokens": max(totals) if totals else 0,
+            "sections_avg": {k: round(v / count, 1) for k, v in per_section.items()},
+        }
+    return report
+
+
+_PACKED_FORMAT = """
+ФОРМАТ:
+- Верни ТОЛЬКО валидный JSON-массив: по одному объекту на каждое сочинение, в том же порядке.
+- Без markdown, без комментариев вне JSON.
+- Ключи каждого объекта строго: essay_id, K1, K1_explanation, K2, K2_explanation, K3, K3_explanation, K4, K4_explanation.
+- essay_id — строка ровно как в заголовке сочинения.
+- Значения K1..K4 — целые числа в допустимых диапазонах.
+- Оценивай каждое сочинение независимо от остальных.
+""".strip()
+
+
+def build_packed_prompt(reqs: List[ScoreRequest], version: str = PROMPT_VERSION) -> str:
+    """
+    Промпт для нескольких сочинений с общими task_text/reference_text_essay/essay_type:
+    общий контекст и шкалы отправляются один раз, ответ — JSON-массив по essay_id.
+    """
+    first = reqs[0]
+    essays = "\n\n".join(
+        f"----- essay_id: {r.essay_id} -----\n{r.essay_text}" for r in reqs
+    )
+    return f"""
+Ты — эксперт по проверке сочинений ОГЭ по русскому языку.
+Оцени КАЖДОЕ из {len(reqs)} сочинений ниже по критериям K1–K4 строго по заданным шкалам.
+Все сочинения написаны по одному заданию и одному опорному тексту.
+
+Ключевая цель: максимально точная и стабильная оценка по критериям.
+Не угадывай: если признак не найден явно — снижай балл.
+
+{_PACKED_FORMAT}
+
+{_CHECKLIST}
+
+ОБЩИЕ ВХОДНЫЕ ДАННЫЕ:
+essay_type: {first.essay_type}
+task_text:
+{first.task_text}
+
+reference_text_essay:
+{first.reference_text_essay}
+
+СОЧИНЕНИЯ:
+{essays}
+
+{_rubric_block(version, first.essay_type)}
+
+{_EXPLANATION_RULES}
 
-Верни JSON.
+Верни JSON-массив.
 """.strip()
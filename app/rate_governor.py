@@ -0,0 +1,115 @@
+import threading
+import time
+from typing import Dict, Optional
+
+
+class GovernorTimeout(TimeoutError):
+    """Слот регулятора не освободился за отведённое время; запрос в GigaChat не отправлялся."""
+
+
+class RateGovernor:
+    """
+    Общий «регулятор» вызовов GigaChat на процесс:
+    - token bucket ограничивает частоту запросов (rate_per_sec, burst)
+    - AIMD управляет числом одновременных запросов:
+      +1/limit за каждый успешный ответ (медленный разгон),
+      limit * decrease_factor при 429/5xx (быстрый откат)
+    - после 429 все новые запросы ждут Retry-After
+    """
+
+    def __init__(
+        self,
+        rate_per_sec: float = 5.0,
+        burst: int = 5,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        decrease_factor: float = 0.5,
+        default_retry_after: float = 1.0,
+    ):
+        self.rate_per_sec = float(rate_per_sec)
+        self.burst = float(burst)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.decrease_factor = float(decrease_factor)
+        self.default_retry_after = float(default_retry_after)
+
+        self._cond = threading.Condition()
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._pause_until = 0.0
+        self._in_flight = 0
+        self._waiting = 0
+
+        self._ok = 0
+        self._throttled = 0
+        self._errors = 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate_per_sec)
+        self._last_refill = now
+
+    def acquire(self, timeout: Optional[float] = None) -> None:
+        """Ждёт свободный слот и токен. Бросает GovernorTimeout, если не дождались за timeout секунд."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._pause_until > now:
+                        wait = self._pause_until - now
+                    elif self._in_flight >= int(self._limit):
+                        wait = None
+                    else:
+                        self._refill(now)
+                        if self._tokens >= 1.0:
+                            self._tokens -= 1.0
+                            self._in_flight += 1
+                            return
+                        wait = (1.0 - self._tokens) / self.rate_per_sec
+
+                    if deadline is not None:
+                        left = deadline - now
+                        if left <= 0:
+                            raise GovernorTimeout("GigaChat rate governor: queue wait timeout")
+                        wait = left if wait is None else min(wait, left)
+                    self._cond.wait(wait)
+            finally:
+                self._waiting -= 1
+
+    def release(self, outcome: str, retry_after: Optional[float] = None) -> None:
+        """
+        Освобождает слот и подстраивает лимит.
+        outcome: "ok" | "throttled" (429) | "error" (5xx/сеть) | "neutral" (прочие 4xx).
+        """
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            if outcome == "ok":
+                self._ok += 1
+                self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+            elif outcome in ("throttled", "error"):
+                self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+                if outcome == "throttled":
+                    self._throttled += 1
+                    pause = retry_after if retry_after is not None else self.default_retry_after
+                    self._pause_until = max(self._pause_until, time.monotonic() + pause)
+                    self._tokens = 0.0
+                else:
+                    self._errors += 1
+            self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "limit": int(self._limit),
+                "limit_exact": round(self._limit, 2),
+                "in_flight": self._in_flight,
+                "queue_depth": self._waiting,
+                "paused_for_sec": round(max(0.0, self._pause_until - time.monotonic()), 2),
+                "rate_per_sec": self.rate_per_sec,
+                "ok": self._ok,
+                "throttled": self._throttled,
+                "errors": self._errors,
+            }
@@ -26,3 +26,45 @@ def build_repair_prompt(bad_text: str) -> str:
 Исходный текст (его нужно привести к схеме):
 {bad_text}
 """.strip()
+
+
+# Короткие описания критериев для точечного дозапроса (полные шкалы — в prompting.py)
+CRITERIA_BRIEF = {
+    "K1": "K1 (0–1): есть ли ясный ответ/позиция именно по вопросу задания (не пересказ).",
+    "K2": "K2 (0–3): примеры-иллюстрации/аргументы из опорного текста (для типа 3 — ещё пример из жизни/литературы) и пояснение роли каждого.",
+    "K3": "K3 (0–2): логичность и связность рассуждения (тезис → доказательства → вывод).",
+    "K4": "K4 (0–1): композиция — вступление, основная часть и вывод.",
+}
+
+
+def build_salvage_prompt(req, known: dict, missing: list) -> str:
+    """
+    Минимальный промпт для дозапроса ТОЛЬКО недостающих полей.
+    Уже полученные поля передаются как контекст и не пересчитываются.
+    Опорный текст включается, только если нужно выставить балл K1/K2.
+    """
+    criteria = sorted({k.split("_")[0] for k in missing})
+    need_reference = any(k in ("K1", "K2") for k in missing)
+
+    known_lines = "\n".join(f"- {k}: {known[k]}" for k in sorted(known) if not k.endswith("_explanation"))
+    schema = ",\n".join(
+        f'  "{k}": {"<int>" if not k.endswith("_explanation") else "<string>"}' for k in sorted(missing)
+    )
+    brief = "\n".join(CRITERIA_BRIEF[c] for c in criteria)
+
+    parts = [
+        "Ты — эксперт по проверке сочинений ОГЭ. Часть оценки уже есть, восстанови ТОЛЬКО недостающие поля.",
+        "Верни ОДИН валидный JSON-объект без markdown и текста вокруг, ровно с этими ключами:",
+        "{\n" + schema + "\n}",
+        "Объяснения — 2–4 предложения по делу. Баллы — целые числа в пределах шкалы.",
+        "",
+        "Критерии:",
+        brief,
+    ]
+    if known_lines:
+        parts += ["", "Уже выставленные баллы (не меняй, объяснения согласуй с ними):", known_lines]
+    parts += ["", f"essay_type: {req.essay_type}", "task_text:", req.task_text]
+    if need_reference:
+        parts += ["", "reference_text_essay:", req.reference_text_essay]
+    parts += ["", "essay_text:", req.essay_text]
+    return "\n".join(parts).strip()
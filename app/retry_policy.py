@@ -0,0 +1,171 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+import requests
+
+from .circuit_breaker import CircuitOpenError
+from .deadline import Deadline, DeadlineExceeded
+from .rate_governor import GovernorTimeout
+
+# Классы ошибок вызова GigaChat
+TRANSIENT = "transient"  # сеть, таймаут, 5xx — повтор с экспоненциальной паузой
+THROTTLE = "throttle"    # 429 — повтор после Retry-After
+AUTH = "auth"            # 401 — токен протух: обновить один раз и повторить
+CONTENT = "content"      # ответ пришёл, но невалиден (формат, JSON, схема) — повтор решает вызывающий код
+FATAL = "fatal"          # 4xx, дедлайн, открытый предохранитель, очередь регулятора — не повторяем
+
+
+def classify(exc: BaseException) -> str:
+    # импорт здесь: gigachat_client сам импортирует этот модуль
+    from .gigachat_client import GigaChatHTTPError, GigaChatFormatError
+
+    # очередь регулятора — локальная перегрузка: запрос до GigaChat не дошёл, повтор её только усилит
+    if isinstance(exc, (DeadlineExceeded, CircuitOpenError, GovernorTimeout)):
+        return FATAL
+    if isinstance(exc, GigaChatHTTPError):
+        if exc.status_code == 401:
+            return AUTH
+        if exc.status_code == 429:
+            return THROTTLE
+        if exc.status_code >= 500 or exc.status_code == 408:
+            return TRANSIENT
+        return FATAL
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout, TimeoutError)):
+        return TRANSIENT
+    if isinstance(exc, (GigaChatFormatError, ValueError)):
+        return CONTENT
+    return FATAL
+
+
+class RetryBudget:
+    """
+    Бюджет повторов на процесс: за последние window_sec повторов не больше
+    ratio * calls + min(min_per_sec * window_sec, calls), где calls — первичные вызовы
+    за то же окно. Запас min_per_sec нужен малому трафику (один повтор при паре вызовов),
+    но не больше самих вызовов: повторы в худшем случае удваивают нагрузку только при
+    единицах вызовов в окне, а на обычном трафике добавляют не больше ~ratio.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_sec: float = 0.1, window_sec: float = 10.0):
+        self.ratio = float(ratio)
+        self.min_per_sec = float(min_per_sec)
+        self.window_sec = float(window_sec)
+        self._lock = threading.Lock()
+        self._calls: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+        self._calls_total = 0
+        self._retries_total = 0
+        self._exhausted_total = 0
+
+    def _trim(self, now: float) -> None:
+        edge = now - self.window_sec
+        for q in (self._calls, self._retries):
+            while q and q[0] < edge:
+                q.popleft()
+
+    def record_call(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            self._calls.append(now)
+            self._calls_total += 1
+
+    def try_spend(self) -> bool:
+        """Разрешение на один повтор; False — бюджет исчерпан, повторять нельзя."""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            calls = len(self._calls)
+            allowed = self.ratio * calls + min(self.min_per_sec * self.window_sec, calls)
+            if len(self._retries) + 1 > allowed:
+                self._exhausted_total += 1
+                return False
+            self._retries.append(now)
+            self._retries_total += 1
+            return True
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            calls = len(self._calls)
+            return {
+                "ratio": self.ratio,
+                "window_calls": calls,
+                "window_retries": len(self._retries),
+                "window_retry_share": round(len(self._retries) / calls, 3) if calls else 0.0,
+                "calls_total": self._calls_total,
+                "retries_total": self._retries_total,
+                "exhausted_total": self._exhausted_total,
+            }
+
+
+class RetryPolicy:
+    """
+    Повторы вызова GigaChat по классу ошибки (см. classify):
+    TRANSIENT/THROTTLE — до max_retries повторов с паузой (full jitter, на 429 — Retry-After),
+    каждый повтор тратит общий RetryBudget; AUTH — один повтор после on_auth (обновление токена);
+    CONTENT и FATAL — без повторов. Пауза, не укладывающаяся в deadline, не начинается.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        budget: Optional[RetryBudget] = None,
+    ):
+        self.max_retries = max(0, int(max_retries))
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.budget = budget or RetryBudget()
+        self._stats_lock = threading.Lock()
+        self._by_class: Dict[str, int] = {}
+
+    def backoff(self, retry: int, retry_after: Optional[float] = None) -> float:
+        """Пауза перед повтором номер retry (0, 1, ...): full jitter, не меньше Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retry)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def _count(self, kind: str) -> None:
+        with self._stats_lock:
+            self._by_class[kind] = self._by_class.get(kind, 0) + 1
+
+    def call(
+        self,
+        fn: Callable[[], Any],
+        deadline: Optional[Deadline] = None,
+        on_auth: Optional[Callable[[], None]] = None,
+    ) -> Any:
+        self.budget.record_call()
+        retries = 0
+        auth_refreshed = False
+        while True:
+            try:
+                return fn()
+            except Exception as e:
+                kind = classify(e)
+                self._count(kind)
+                if kind == AUTH and on_auth is not None and not auth_refreshed:
+                    auth_refreshed = True
+                    on_auth()
+                    continue
+                if kind not in (TRANSIENT, THROTTLE) or retries >= self.max_retries:
+                    raise
+                delay = self.backoff(retries, getattr(e, "retry_after", None) if kind == THROTTLE else None)
+                if deadline is not None and not deadline.allows(delay + deadline.min_call_sec):
+                    raise
+                if not self.budget.try_spend():
+                    raise
+                retries += 1
+                time.sleep(delay)
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            by_class = dict(self._by_class)
+        return {"max_retries": self.max_retries, "errors_by_class": by_class, "budget": self.budget.stats()}
@@ -1,14 +1,27 @@
 # app/routes.py
+import hashlib
+import hmac
 import json
-from flask import Blueprint, jsonify, request, render_template
+import math
+import queue
+import threading
+import time
+from flask import Blueprint, Response, current_app, jsonify, request, render_template
 
 from .schemas import (
     ScoreRequest,
     validate_score_output,
     validate_batch_input,
 )
-from .scoring import score_essay
-from .data_store import get_by_essay_id, get_all_essays, get_essays_by_ids
+from .scoring import score_essay, client_stats, repair_stats, coalesce_stats, circuit_stats, check_circuit
+from .batch import score_batch as run_batch, split_results
+from .llm_cache import CACHE_USE, CACHE_MODES
+from .data_store import get_by_essay_id, get_essays_by_ids, load_inputs, reload_inputs, data_stats
+from .essay_index import get_index, StaleCursorError
+from .jobs import get_store, jobs_stats
+from .warmup import warmup_report
+from .deadline import Deadline, DeadlineExceeded
+from .circuit_breaker import CircuitOpenError, OPEN
 
 bp = Blueprint("api", __name__)
 
@@ -18,24 +31,132 @@ def pretty_json(obj) -> str:
     return json.dumps(obj, ensure_ascii=False, indent=2)
 
 
+def _cache_mode() -> str:
+    """Режим кеша LLM из query-параметра ?cache=use|refresh|bypass."""
+    mode = request.args.get("cache", CACHE_USE)
+    if mode not in CACHE_MODES:
+        raise ValueError(f"cache must be one of {list(CACHE_MODES)}")
+    return mode
+
+
 # -------------------------
 # API endpoints (для интеграций/скриптов)
 # -------------------------
 
+def _deadline() -> Deadline:
+    """Срок текущего запроса на оценку (REQUEST_DEADLINE_SEC), отсчёт — с начала обработки."""
+    cfg = current_app.config
+    return Deadline.after(cfg.get("REQUEST_DEADLINE_SEC", 100), cfg.get("DEADLINE_MIN_CALL_SEC", 3))
+
+
+def _circuit_open(e: CircuitOpenError):
+    """503 + Retry-After: GigaChat недоступен, запрос отклонён без вызова."""
+    resp = jsonify({"error": str(e), "retry_after": round(e.retry_after, 1)})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+    return resp
+
+
+def _error_status(e: Exception) -> int:
+    if isinstance(e, DeadlineExceeded):
+        return 504
+    if isinstance(e, CircuitOpenError):
+        return 503
+    return 400
+
+
 @bp.get("/health")
 def health():
-    return jsonify({"status": "ok"})
+    """Сервис жив всегда; при открытом предохранителе GigaChat — status "degraded" (код 200, чтобы не перезапускали)."""
+    breaker = circuit_stats()
+    status = "degraded" if breaker is not None and breaker["state"] == OPEN else "ok"
+    return jsonify({"status": status, "gigachat": breaker or {"state": "closed"}})
+
+
+@bp.get("/api/metrics")
+def metrics():
+    """Счётчики клиента GigaChat, починки JSON, склейки запросов, заданий, входных данных и прогрева текущего воркера."""
+    return jsonify({
+        "client": client_stats(),
+        "repair": repair_stats(),
+        "singleflight": coalesce_stats(),
+        "jobs": jobs_stats(),
+        "data": data_stats(),
+        "warmup": warmup_report(),
+    })
+
+
+def _admin_allowed() -> bool:
+    token = current_app.config.get("ADMIN_TOKEN", "")
+    if not token:
+        # без настроенного токена /admin/* закрыты
+        return False
+    given = request.headers.get("X-Admin-Token", "")
+    return hmac.compare_digest(given.encode("utf-8"), token.encode("utf-8"))
+
+
+@bp.post("/admin/reload_data")
+def admin_reload_data():
+    """
+    Перечитать входные данные без рестарта (?force=1 — даже если файлы не менялись).
+    Новый снимок подменяет старый атомарно; при ошибке остаётся старый.
+    """
+    if not _admin_allowed():
+        return jsonify({"error": "forbidden"}), 403
+    try:
+        out = reload_inputs(force=request.args.get("force") == "1")
+    except Exception as e:
+        return jsonify({"error": str(e), **data_stats()}), 500
+    # индекс нового снимка строим здесь, а не в первом запросе /api/essays
+    try:
+        get_index(load_inputs(), current_app.config["PERSIST_DIR"])
+    except Exception as e:
+        current_app.logger.warning("essay index build after reload failed: %s", e)
+    return jsonify(out)
 
 
 @bp.get("/api/essays")
 def get_essays():
-    """Получить список всех доступных сочинений."""
+    """
+    Список сочинений постранично: ?limit=&cursor=&essay_type=2|3&q=<поиск по ID/тексту/заданию>.
+    Ответ с ETag: неизменившаяся страница при If-None-Match отдаётся как 304.
+    """
+    cfg = current_app.config
     try:
-        essays = get_all_essays()
-        return jsonify({"essays": essays})
+        limit = int(request.args.get("limit", cfg["ESSAYS_PAGE_SIZE"]))
+        if not 1 <= limit <= cfg["ESSAYS_MAX_PAGE_SIZE"]:
+            raise ValueError(f"limit must be in 1..{cfg['ESSAYS_MAX_PAGE_SIZE']}")
+        essay_type = request.args.get("essay_type") or None
+        if essay_type is not None:
+            essay_type = int(essay_type)
+        cursor = request.args.get("cursor") or None
+        q = (request.args.get("q") or "").strip() or None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        index = get_index(load_inputs(), cfg["PERSIST_DIR"])
+        # страница однозначно определяется версией данных и параметрами запроса
+        etag = hashlib.sha256(
+            json.dumps([index.version, limit, cursor, essay_type, q], ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:32]
+        if request.if_none_match.contains_weak(etag):
+            resp = current_app.response_class(status=304)
+            resp.set_etag(etag, weak=True)
+            return resp
+        page = index.query(limit=limit, cursor=cursor, essay_type=essay_type, q=q)
+    except StaleCursorError as e:
+        return jsonify({"error": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    resp = jsonify(page)
+    resp.set_etag(etag, weak=True)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
 
 @bp.post("/api/essays/batch")
 def get_essays_batch():
@@ -54,9 +175,15 @@ def score_one():
     data = request.get_json(silent=True) or {}
     try:
         req_obj = ScoreRequest.from_json(data)
-        out = score_essay(req_obj)
+        out = score_essay(
+            req_obj, cache_mode=_cache_mode(), deadline=_deadline(), hedge=current_app.config["HEDGE_ENABLED"]
+        )
         validate_score_output(out)
         return jsonify(out)
+    except DeadlineExceeded as e:
+        return jsonify({"error": str(e), "partial": e.partial}), 504
+    except CircuitOpenError as e:
+        return _circuit_open(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
@@ -67,23 +194,146 @@ def score_batch():
     items = data.get("items", None)
 
     try:
-        items = validate_batch_input(items, max_batch_size=request.app.config["MAX_BATCH_SIZE"])
+        items = validate_batch_input(items, max_batch_size=current_app.config["MAX_BATCH_SIZE"])
+        cache_mode = _cache_mode()
     except Exception as e:
         return jsonify({"error": str(e)}), 400
+    try:
+        check_circuit()
+    except CircuitOpenError as e:
+        return _circuit_open(e)
+
+    # сочинения оцениваются параллельно (SCORING_CONCURRENCY), порядок результатов сохраняется
+    started = time.perf_counter()
+    out = split_results(run_batch(items, cache_mode=cache_mode, deadline=_deadline()))
+    out["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return jsonify(out)
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 
-    results = []
-    errors = []
+@bp.post("/score_batch/stream")
+def score_batch_stream():
+    """
+    То же, что /score_batch, но результаты отдаются потоком Server-Sent Events
+    по мере готовности (в порядке завершения, поле index — позиция в items):
+    event: start  {"total"}
+    event: result {"index", "essay_id", "ok", "result" | "error", "elapsed_ms"}
+    event: done   {"total", "ok", "failed", "elapsed_ms"}
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("items", None)
+
+    try:
+        items = validate_batch_input(items, max_batch_size=current_app.config["MAX_BATCH_SIZE"])
+        cache_mode = _cache_mode()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        check_circuit()
+    except CircuitOpenError as e:
+        return _circuit_open(e)
+
+    app = current_app._get_current_object()
+    events: "queue.Queue" = queue.Queue()
+    deadline = _deadline()
+    # клиент отключился — не начинаем оставшиеся элементы и не копим их результаты
+    cancel = threading.Event()
+
+    def _on_result(i: int, entry) -> None:
+        if not cancel.is_set():
+            events.put(entry)
+
+    def _run() -> None:
+        # движок работает в отдельном потоке, ответ читает события из очереди
+        with app.app_context():
+            try:
+                run_batch(
+                    items, cache_mode=cache_mode, deadline=deadline,
+                    on_result=_on_result, cancel=cancel,
+                )
+            except Exception as e:
+                events.put({"fatal": str(e)})
+            finally:
+                events.put(None)
 
-    for item in items:
+    def _stream():
+        started = time.perf_counter()
+        ok = failed = 0
         try:
-            req_obj = ScoreRequest.from_json(item)
-            out = score_essay(req_obj)
-            validate_score_output(out)
-            results.append(out)
-        except Exception as e:
-            errors.append({"essay_id": item.get("essay_id"), "error": str(e)})
+            yield _sse("start", {"total": len(items)})
+            while True:
+                try:
+                    entry = events.get(timeout=15)
+                except queue.Empty:
+                    # комментарий SSE держит соединение живым за прокси
+                    yield ": keep-alive\n\n"
+                    continue
+                if entry is None:
+                    break
+                if "fatal" in entry:
+                    yield _sse("error", {"error": entry["fatal"]})
+                    continue
+                ok += entry["ok"]
+                failed += not entry["ok"]
+                yield _sse("result", entry)
+            yield _sse("done", {
+                "total": len(items),
+                "ok": ok,
+                "failed": failed,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            })
+        finally:
+            # GeneratorExit при обрыве соединения: сервер закрывает генератор
+            cancel.set()
+
+    threading.Thread(target=_run, name="score-batch-stream", daemon=True).start()
+    return Response(
+        _stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@bp.post("/jobs")
+def create_job():
+    """
+    Асинхронная оценка большой пачки: {"items": [...]} или {"essay_ids": [...]} (из data_store).
+    Возвращает job_id сразу; прогресс — GET /jobs/<job_id>.
+    """
+    data = request.get_json(silent=True) or {}
+    max_items = current_app.config["JOB_MAX_ITEMS"]
+    try:
+        cache_mode = _cache_mode()
+        if data.get("essay_ids") is not None:
+            essay_ids = data["essay_ids"]
+            if not isinstance(essay_ids, list):
+                raise ValueError("essay_ids must be a list")
+            items = get_essays_by_ids(essay_ids)
+            found = {item["essay_id"] for item in items}
+            missing = [str(e) for e in essay_ids if str(e) not in found]
+            if missing:
+                raise ValueError(f"essay_ids not found: {missing[:20]}")
+        else:
+            items = data.get("items", None)
+        items = validate_batch_input(items, max_batch_size=max_items)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+    job_id = get_store(current_app.config).create_job(items, cache_mode=cache_mode)
+    return jsonify({"job_id": job_id, "status": "queued", "total": len(items)}), 202
 
-    return jsonify({"results": results, "errors": errors})
+
+@bp.get("/jobs/<job_id>")
+def get_job(job_id: str):
+    """Прогресс задания и готовые результаты (?results=0 — только прогресс)."""
+    include_results = request.args.get("results", "1") != "0"
+    job = get_store(current_app.config).get_job(job_id, include_results=include_results)
+    if job is None:
+        return jsonify({"error": f"job not found: {job_id}"}), 404
+    return jsonify(job)
 
 
 # -------------------------
@@ -139,7 +389,7 @@ def ui_app():
 @bp.post("/ui/load_one")
 def ui_load_one():
     """
-    Подтягиваем данные для одного эссе по essay_id из data/inputs_for_scoring.csv
+    Подтягиваем данные для одного эссе по essay_id из входных данных (data_store)
     """
     essay_id = (request.form.get("essay_id") or "").strip()
     batch_payload = request.form.get("batch_payload", "")
@@ -147,7 +397,7 @@ def ui_load_one():
     try:
         loaded = get_by_essay_id(essay_id)
         if not loaded:
-            raise ValueError(f"essay_id={essay_id} не найден в data/inputs_for_scoring.csv (запусти scripts/prepare_inputs.py)")
+            raise ValueError(f"essay_id={essay_id} не найден во входных данных data/ (запусти scripts/prepare_inputs.py)")
 
         return render_template(
             "app.html",
@@ -188,7 +438,7 @@ def ui_score_one():
         }
 
         req_obj = ScoreRequest.from_json(one_form)
-        out = score_essay(req_obj)
+        out = score_essay(req_obj, deadline=_deadline(), hedge=current_app.config["HEDGE_ENABLED"])
         validate_score_output(out)
 
         return render_template(
@@ -221,7 +471,7 @@ def ui_score_one():
             result_data=None,
             batch_pretty=None,
             error=str(e),
-        ), 400
+        ), _error_status(e)
 
 
 @bp.post("/ui/score_batch")
@@ -231,21 +481,12 @@ def ui_score_batch():
         data = json.loads(payload)
 
         items = data.get("items", None)
-        items = validate_batch_input(items, max_batch_size=request.app.config["MAX_BATCH_SIZE"])
+        items = validate_batch_input(items, max_batch_size=current_app.config["MAX_BATCH_SIZE"])
+        check_circuit()
 
-        results = []
-        errors = []
-
-        for item in items:
-            try:
-                req_obj = ScoreRequest.from_json(item)
-                out = score_essay(req_obj)
-                validate_score_output(out)
-                results.append(out)
-            except Exception as e:
-                errors.append({"essay_id": item.get("essay_id"), "error": str(e)})
-
-        batch_result = {"results": results, "errors": errors}
+        started = time.perf_counter()
+        batch_result = split_results(run_batch(items, deadline=_deadline()))
+        batch_result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
 
         return render_template(
             "app.html",
@@ -268,4 +509,4 @@ def ui_score_batch():
             result_data=None,
             batch_pretty=None,
             error=str(e),
-        ), 400
+        ), _error_status(e)
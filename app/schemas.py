@@ -33,12 +33,35 @@ class ScoreRequest:
         )
 
 
-def validate_score_output(out: Dict[str, Any]) -> None:
-    # Диапазоны из задания:
-    # K1: 0..1, K2: 0..3, K3: 0..2, K4: 0..1
-    ranges = {"K1": (0, 1), "K2": (0, 3), "K3": (0, 2), "K4": (0, 1)}
+# Диапазоны из задания:
+# K1: 0..1, K2: 0..3, K3: 0..2, K4: 0..1
+SCORE_RANGES = {"K1": (0, 1), "K2": (0, 3), "K3": (0, 2), "K4": (0, 1)}
+
+
+def score_output_json_schema() -> Dict[str, Any]:
+    """JSON-schema ответа K1–K4 (те же поля и диапазоны, что проверяет validate_score_output)."""
+    properties: Dict[str, Any] = {}
+    for k, (lo, hi) in SCORE_RANGES.items():
+        properties[k] = {"type": "integer", "minimum": lo, "maximum": hi, "description": f"Балл {k} ({lo}–{hi})"}
+        properties[f"{k}_explanation"] = {"type": "string", "description": f"Пояснение к баллу {k}, 2–4 предложения"}
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties.keys()),
+    }
+
 
-    for k, (lo, hi) in ranges.items():
+# Описание функции для structured output / function calling GigaChat
+SCORE_FUNCTION_NAME = "submit_essay_scores"
+SCORE_FUNCTION = {
+    "name": SCORE_FUNCTION_NAME,
+    "description": "Сохранить оценку сочинения ОГЭ по критериям K1–K4 с пояснениями.",
+    "parameters": score_output_json_schema(),
+}
+
+
+def validate_score_output(out: Dict[str, Any]) -> None:
+    for k, (lo, hi) in SCORE_RANGES.items():
         if k not in out:
             raise ValueError(f"Missing field: {k}")
         if not isinstance(out[k], int):
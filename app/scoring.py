@@ -1,11 +1,23 @@
-from typing import Dict
+import asyncio
+import copy
+import hashlib
+import json
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
 from flask import current_app
 
-from .schemas import ScoreRequest, validate_score_output
-from .prompting import build_prompt, PROMPT_VERSION
-from .json_utils import extract_json
+from .schemas import ScoreRequest, validate_score_output, SCORE_RANGES, SCORE_FUNCTION, SCORE_FUNCTION_NAME
+from .prompting import compile_prompt, build_packed_prompt, PROMPT_VERSION
+from .json_utils import extract_json, extract_json_objects, repair_json
 from .gigachat_client import GigaChatClient
-from .repair import build_repair_prompt
+from .rate_governor import RateGovernor
+from .llm_cache import LLMCache, CACHE_USE
+from .repair import build_repair_prompt, build_salvage_prompt
+from .singleflight import SingleFlight
+from .deadline import Deadline, DeadlineExceeded
+from .circuit_breaker import CircuitBreaker
+from .retry_policy import RetryBudget, RetryPolicy, classify, CONTENT
+from .hedging import Hedger
 
 def normalize_keys(data: dict) -> dict:
     """
@@ -92,39 +104,357 @@ NEEDED_KEYS = {
 }
 
 
+# Один клиент на процесс (gunicorn-воркер): общий пул соединений и общий OAuth-токен
+_CLIENT: Optional[GigaChatClient] = None
+_CLIENT_LOCK = threading.Lock()
+
+
 def _get_client() -> GigaChatClient:
-    cfg = current_app.config
-    return GigaChatClient(
-        auth_token=cfg.get("GIGACHAT_TOKEN", ""),
-        timeout=cfg.get("REQUEST_TIMEOUT_SEC", 60),
-        verify_ssl=False,
-    )
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                cfg = current_app.config
+                cache = None
+                if cfg.get("LLM_CACHE_ENABLED", False):
+                    cache = LLMCache(
+                        cfg["LLM_CACHE_PATH"],
+                        max_entries=cfg.get("LLM_CACHE_MAX_ENTRIES", 20000),
+                        max_bytes=cfg.get("LLM_CACHE_MAX_MB", 200) * 1024 * 1024,
+                        ttl_sec=cfg.get("LLM_CACHE_TTL_SEC", 30 * 24 * 3600),
+                    )
+                breaker = None
+                if cfg.get("CIRCUIT_ENABLED", True):
+                    breaker = CircuitBreaker(
+                        window_sec=cfg.get("CIRCUIT_WINDOW_SEC", 30),
+                        min_calls=cfg.get("CIRCUIT_MIN_CALLS", 5),
+                        error_rate=cfg.get("CIRCUIT_ERROR_RATE", 0.5),
+                        slow_call_sec=cfg.get("CIRCUIT_SLOW_CALL_SEC", 30),
+                        slow_rate=cfg.get("CIRCUIT_SLOW_RATE", 0.8),
+                        open_sec=cfg.get("CIRCUIT_OPEN_SEC", 20),
+                        half_open_probes=cfg.get("CIRCUIT_HALF_OPEN_PROBES", 2),
+                    )
+                _CLIENT = GigaChatClient(
+                    auth_token=cfg.get("GIGACHAT_TOKEN", ""),
+                    timeout=cfg.get("REQUEST_TIMEOUT_SEC", 60),
+                    verify_ssl=False,
+                    pool_size=cfg.get("GIGACHAT_POOL_SIZE", 10),
+                    governor=RateGovernor(
+                        rate_per_sec=cfg.get("GIGACHAT_RATE_PER_SEC", 5.0),
+                        burst=cfg.get("GIGACHAT_BURST", 5),
+                        initial_limit=cfg.get("GIGACHAT_INITIAL_CONCURRENCY", 4),
+                        min_limit=cfg.get("GIGACHAT_MIN_CONCURRENCY", 1),
+                        max_limit=cfg.get("GIGACHAT_MAX_CONCURRENCY", 16),
+                    ),
+                    cache=cache,
+                    breaker=breaker,
+                    retry=RetryPolicy(
+                        max_retries=cfg.get("GIGACHAT_THROTTLE_RETRIES", 3),
+                        base_delay=cfg.get("RETRY_BASE_DELAY_SEC", 0.5),
+                        max_delay=cfg.get("RETRY_MAX_DELAY_SEC", 8.0),
+                        budget=RetryBudget(
+                            ratio=cfg.get("RETRY_BUDGET_RATIO", 0.2),
+                            min_per_sec=cfg.get("RETRY_BUDGET_MIN_PER_SEC", 0.1),
+                            window_sec=cfg.get("RETRY_BUDGET_WINDOW_SEC", 10.0),
+                        ),
+                    ),
+                    hedger=Hedger(
+                        quantile=cfg.get("HEDGE_QUANTILE", 0.95),
+                        min_samples=cfg.get("HEDGE_MIN_SAMPLES", 20),
+                        min_delay=cfg.get("HEDGE_MIN_DELAY_SEC", 1.0),
+                        max_extra_ratio=cfg.get("HEDGE_MAX_EXTRA_RATIO", 0.1),
+                        max_workers=cfg.get("GIGACHAT_POOL_SIZE", 10),
+                    ),
+                )
+    return _CLIENT
+
+
+def reset_client() -> None:
+    """Закрывает общий клиент (например, после fork), следующий вызов создаст новый."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is not None:
+            _CLIENT.close()
+        _CLIENT = None
+
+
+def client_stats() -> Dict:
+    """Статистика общего клиента (пустая, если клиент ещё не создавался)."""
+    return _CLIENT.stats() if _CLIENT is not None else {}
+
+
+def circuit_stats() -> Optional[Dict]:
+    """Состояние предохранителя GigaChat (None — клиент ещё не создан или предохранитель выключен)."""
+    client = _CLIENT
+    if client is None or client.breaker is None:
+        return None
+    return client.breaker.stats()
+
+
+def check_circuit() -> None:
+    """Бросает CircuitOpenError, если GigaChat сейчас считается недоступным (для быстрого отказа пачек)."""
+    client = _CLIENT
+    if client is not None and client.breaker is not None:
+        client.breaker.check()
+
+
+# Сколько ответов починено локально и сколько потребовали LLM-repair (на процесс)
+_REPAIR_STATS = {
+    "essays": 0, "local_repairs": 0, "local_repairs_incomplete": 0, "salvages": 0, "llm_repairs": 0, "by_fix": {},
+}
+_REPAIR_STATS_LOCK = threading.Lock()
+
+
+def _record_repair(local_fixes: list, llm_repaired: bool, salvaged: list) -> None:
+    with _REPAIR_STATS_LOCK:
+        _REPAIR_STATS["essays"] += 1
+        if salvaged:
+            _REPAIR_STATS["salvages"] += 1
+        if local_fixes:
+            # экономия — только если локальная починка дала полный ответ без LLM-дозапросов
+            if llm_repaired or salvaged:
+                _REPAIR_STATS["local_repairs_incomplete"] += 1
+            else:
+                _REPAIR_STATS["local_repairs"] += 1
+            for name in local_fixes:
+                _REPAIR_STATS["by_fix"][name] = _REPAIR_STATS["by_fix"].get(name, 0) + 1
+        if llm_repaired:
+            _REPAIR_STATS["llm_repairs"] += 1
+
+
+def repair_stats() -> Dict:
+    """
+    Статистика починки JSON. local_repairs — локальная починка дала полный валидный ответ
+    (сэкономлен минимум один LLM-вызов); local_repairs_incomplete — починка была,
+    но ответ всё равно дозапрашивали (salvage / json_repair).
+    """
+    with _REPAIR_STATS_LOCK:
+        essays = _REPAIR_STATS["essays"]
+        return {
+            "essays": essays,
+            "local_repairs": _REPAIR_STATS["local_repairs"],
+            "local_repairs_incomplete": _REPAIR_STATS["local_repairs_incomplete"],
+            "salvages": _REPAIR_STATS["salvages"],
+            "llm_repairs": _REPAIR_STATS["llm_repairs"],
+            "by_fix": dict(_REPAIR_STATS["by_fix"]),
+            "llm_calls_saved_per_1000": round(1000 * _REPAIR_STATS["local_repairs"] / essays, 1) if essays else 0.0,
+        }
+
+
+# Одинаковые одновременные запросы на оценку выполняются один раз (на процесс)
+_FLIGHTS = SingleFlight()
+
+
+def coalesce_stats() -> Dict:
+    """Сколько вызовов score_essay выполнено и сколько склеено с уже идущими."""
+    return _FLIGHTS.stats()
+
+
+def _flight_key(req: ScoreRequest, prompt_version: str, model: str, cache_mode: str) -> str:
+    # essay_id в ключ не входит: одно и то же сочинение под разными id оценивается один раз
+    def _norm(text: str) -> str:
+        return text.replace("\r\n", "\n").strip()
+
+    payload = [
+        prompt_version,
+        model,
+        cache_mode,
+        req.essay_type,
+        _norm(req.task_text),
+        _norm(req.reference_text_essay),
+        _norm(req.essay_text),
+    ]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
 
 
 def _has_all_keys(data: dict) -> bool:
     return isinstance(data, dict) and NEEDED_KEYS.issubset(set(data.keys()))
 
 
-def score_essay(req: ScoreRequest) -> Dict:
+def _valid_fields(data: Optional[dict]) -> dict:
+    """Только корректные поля ответа: баллы в диапазоне и непустые объяснения."""
+    if not isinstance(data, dict):
+        return {}
+    out = {}
+    for k, (lo, hi) in SCORE_RANGES.items():
+        v = data.get(k)
+        if v is not None and not isinstance(v, bool):
+            try:
+                v = int(v)
+            except (TypeError, ValueError):
+                v = None
+            if v is not None and lo <= v <= hi:
+                out[k] = v
+        exp_key = f"{k}_explanation"
+        exp = data.get(exp_key)
+        if isinstance(exp, str) and exp.strip():
+            out[exp_key] = exp
+    return out
+
+
+def _parse_response(raw: str) -> Tuple[Optional[dict], list]:
+    """
+    Разбор ответа модели без LLM: extract_json, а если не вышло или не хватает
+    ключей — локальная починка repair_json. Возвращает (data, применённые правки).
+    """
+    data = None
+    try:
+        data = normalize_keys(extract_json(raw))
+    except Exception:
+        data = None
+    if _has_all_keys(data):
+        return data, []
+
+    try:
+        fixed, fixes = repair_json(raw)
+        fixed = normalize_keys(fixed)
+    except ValueError:
+        return data, []
+    if len(_valid_fields(fixed)) > len(_valid_fields(data)):
+        return fixed, fixes
+    return data, []
+
+
+def _answers(keys) -> Callable[[str], bool]:
+    """
+    Проверка ответа для chat_completion(cache_if=...): после разбора есть валидные keys.
+    Неполный или невалидный ответ в кеш не попадает и из кеша не повторяется.
+    """
+    keys = set(keys)
+
+    def _check(raw: str) -> bool:
+        try:
+            data, _ = _parse_response(raw)
+        except Exception:
+            return False
+        return keys.issubset(_valid_fields(data))
+
+    return _check
+
+
+def _salvage_max_tokens(missing: list) -> int:
+    # ~150 токенов на объяснение, баллы почти бесплатны
+    return 60 + 150 * sum(1 for k in missing if k.endswith("_explanation"))
+
+
+def _make_output(req: ScoreRequest, data: dict, meta: dict) -> Dict:
+    # невалидные значения ({"K1": null}, "K1": "два") — ошибка содержимого ответа (ValueError),
+    # а не программы: её повторяет _score_essay
+    try:
+        return {
+            "essay_id": req.essay_id,
+            "K1": int(data["K1"]),
+            "K1_explanation": str(data["K1_explanation"]),
+            "K2": int(data["K2"]),
+            "K2_explanation": str(data["K2_explanation"]),
+            "K3": int(data["K3"]),
+            "K3_explanation": str(data["K3_explanation"]),
+            "K4": int(data["K4"]),
+            "K4_explanation": str(data["K4_explanation"]),
+            "meta": meta,
+        }
+    except (TypeError, ValueError, KeyError) as e:
+        raise ValueError(f"LLM JSON has invalid values: {e}") from None
+
+
+def score_essay(
+    req: ScoreRequest,
+    cache_mode: str = CACHE_USE,
+    deadline: Optional[Deadline] = None,
+    hedge: bool = False,
+) -> Dict:
+    """
+    Оценка одного сочинения (см. _score_essay).
+    Если такое же сочинение (тот же текст/задание/тип, версия промпта и модель) уже
+    оценивается в этом процессе, ждём тот вызов и отдаём копию его результата
+    со своим essay_id и meta.coalesced=True. Отключается SINGLEFLIGHT_ENABLED=0.
+    deadline — срок запроса (см. app.deadline); не успели — DeadlineExceeded.
+    hedge — хеджировать основной вызов GigaChat (интерактивные запросы, см. Hedger).
+    """
+    if not current_app.config.get("SINGLEFLIGHT_ENABLED", True):
+        return _score_essay(req, cache_mode, deadline, hedge)
+
+    key = _flight_key(
+        req,
+        current_app.config.get("PROMPT_VERSION", PROMPT_VERSION),
+        current_app.config.get("GIGACHAT_MODEL", "GigaChat"),
+        cache_mode,
+    )
+    try:
+        # чужой вызов ждём не дольше своего срока (у лидера может быть срок длиннее)
+        out, shared = _FLIGHTS.do(
+            key,
+            lambda: _score_essay(req, cache_mode, deadline, hedge),
+            timeout=None if deadline is None else deadline.remaining(),
+        )
+    except TimeoutError as e:
+        if deadline is not None and not deadline.allows():
+            if isinstance(e, DeadlineExceeded):
+                raise
+            raise DeadlineExceeded("deadline exceeded while waiting for the same essay being scored")
+        # не успел лидер с более коротким сроком, а у нас время есть (или срока нет) —
+        # оцениваем сами, без склейки
+        return _score_essay(req, cache_mode, deadline, hedge)
+    if not shared:
+        return out
+    # результат лидера не трогаем: каждый ждавший получает свою копию
+    out = copy.deepcopy(out)
+    out["essay_id"] = req.essay_id
+    out["meta"]["coalesced"] = True
+    return out
+
+
+def _score_essay(
+    req: ScoreRequest,
+    cache_mode: str = CACHE_USE,
+    deadline: Optional[Deadline] = None,
+    hedge: bool = False,
+) -> Dict:
     """
     Реальный скоринг:
-    - строим промпт
+    - компилируем промпт (версия шаблона PROMPT_VERSION, бюджет PROMPT_INPUT_TOKEN_BUDGET)
     - вызываем GigaChat
-    - парсим JSON
+    - парсим JSON (с локальной починкой)
+    - если часть полей валидна -> дозапрашиваем только недостающие (salvage)
     - если JSON сломан ИЛИ нет ключей -> делаем repair-запрос
     - валидируем диапазоны/поля
-    - 1 ретрай если всё равно плохо
+    - 1 ретрай (из общего бюджета повторов), если ответ всё равно невалиден;
+      сетевые ошибки, 5xx и 429 повторяет сам клиент (RetryPolicy), здесь они не повторяются
+    cache_mode ("use" / "refresh" / "bypass") применяется ко всем вызовам LLM.
+    deadline делится между попытками и починками: каждый вызов получает таймаут
+    не больше остатка, шаг без запаса времени (DEADLINE_MIN_CALL_SEC) не начинается.
+    Тогда — DeadlineExceeded с уже полученными валидными полями в .partial.
     """
     client = _get_client()
-    prompt = build_prompt(req)
+    prompt_version = current_app.config.get("PROMPT_VERSION", PROMPT_VERSION)
+    compiled = compile_prompt(
+        req,
+        version=prompt_version,
+        budget=int(current_app.config.get("PROMPT_INPUT_TOKEN_BUDGET", 0)),
+    )
+    prompt = compiled.text
 
     model_name = current_app.config.get("GIGACHAT_MODEL", "GigaChat")
     temperature = float(current_app.config.get("TEMPERATURE", 0.0))
     max_tokens = int(current_app.config.get("MAX_TOKENS", 900))
 
+    # structured output: схема K1–K4 уходит как функция, ответ читается из её arguments
+    structured = bool(current_app.config.get("GIGACHAT_STRUCTURED_OUTPUT", False))
+    fn_kwargs = {}
+    if structured:
+        fn_kwargs = {"functions": [SCORE_FUNCTION], "function_call": {"name": SCORE_FUNCTION_NAME}}
+
     last_err = None
+    # лучшие валидные поля за все шаги — отдаются как partial, если не успеем
+    best: dict = {}
 
     for attempt in range(2):
+        if attempt and deadline is not None and not deadline.allows():
+            raise DeadlineExceeded(
+                f"deadline exceeded before retry, last error: {last_err}", partial=best
+            )
+        if attempt and not client.retry.budget.try_spend():
+            raise RuntimeError(f"LLM scoring failed, retry budget exhausted: {last_err}")
         try:
             repaired = False
 
@@ -137,14 +467,42 @@ def score_essay(req: ScoreRequest) -> Dict:
                 ),
                 temperature=temperature,
                 max_tokens=max_tokens,
+                cache_mode=cache_mode,
+                deadline=deadline,
+                hedge=hedge,
+                cache_if=_answers(NEEDED_KEYS),
+                **fn_kwargs,
             )
 
-            # 1) Пытаемся распарсить
-            data = None
-            try:
-                data = normalize_keys(extract_json(raw))
-            except Exception:
-                data = None
+            # 1) Пытаемся распарсить (+ локальная починка без LLM: запятые, кавычки, обрезанный JSON)
+            data, local_fixes = _parse_response(raw)
+
+            # 1.5) Частичный ответ: оставляем валидные поля и дозапрашиваем только недостающие
+            salvaged = []
+            valid = _valid_fields(data)
+            if len(valid) > len(best):
+                best = dict(valid)
+            missing = sorted(NEEDED_KEYS - set(valid))
+            if not missing:
+                data = valid
+            elif valid:
+                part_raw = client.chat_completion(
+                    model=model_name,
+                    prompt=build_salvage_prompt(req, valid, missing),
+                    temperature=0.0,
+                    max_tokens=_salvage_max_tokens(missing),
+                    cache_mode=cache_mode,
+                    deadline=deadline,
+                    cache_if=_answers(missing),
+                )
+                part, _ = _parse_response(part_raw)
+                valid.update({k: v for k, v in _valid_fields(part).items() if k in missing})
+                if len(valid) > len(best):
+                    best = dict(valid)
+                if NEEDED_KEYS.issubset(valid):
+                    # дозапрос помог — только тогда это salvage (иначе ответ даст repair ниже)
+                    data = valid
+                    salvaged = missing
 
             # 2) Если не распарсилось ИЛИ распарсилось, но не хватает ключей -> repair
             if not _has_all_keys(data):
@@ -156,12 +514,12 @@ def score_essay(req: ScoreRequest) -> Dict:
                     prompt=build_repair_prompt(raw),
                     temperature=0.0,
                     max_tokens=600,
+                    cache_mode=cache_mode,
+                    deadline=deadline,
+                    cache_if=_answers(NEEDED_KEYS),
                 )
 
-                try:
-                    data = normalize_keys(extract_json(fixed_raw))
-                except Exception:
-                    data = None
+                data, _ = _parse_response(fixed_raw)
 
                 # REPAIR #2: ультра-жёсткий формат (если repair #1 не помог)
                 if not _has_all_keys(data):
@@ -184,14 +542,12 @@ def score_essay(req: ScoreRequest) -> Dict:
                         prompt=hard_repair_prompt,
                         temperature=0.0,
                         max_tokens=600,
+                        cache_mode=cache_mode,
+                        deadline=deadline,
+                        cache_if=_answers(NEEDED_KEYS),
                     )
 
-                    try:
-                        data = normalize_keys(extract_json(fixed_raw2))
-                    except Exception:
-                        data = None
-
-
+                    data, _ = _parse_response(fixed_raw2)
 
             # 3) Если даже после repair нет ключей — отдаём понятную ошибку
             if not _has_all_keys(data):
@@ -201,29 +557,151 @@ def score_essay(req: ScoreRequest) -> Dict:
                     f"Raw (truncated)={str(raw)[:300]}"
                 )
 
-            out = {
-                "essay_id": req.essay_id,
-                "K1": int(data["K1"]),
-                "K1_explanation": str(data["K1_explanation"]),
-                "K2": int(data["K2"]),
-                "K2_explanation": str(data["K2_explanation"]),
-                "K3": int(data["K3"]),
-                "K3_explanation": str(data["K3_explanation"]),
-                "K4": int(data["K4"]),
-                "K4_explanation": str(data["K4_explanation"]),
-                "meta": {
-                    "model": model_name,
-                    "prompt_version": PROMPT_VERSION,
-                    "attempt": attempt,
-                    "essay_type": req.essay_type,
-                    "json_repair": repaired,
-                },
-            }
+            out = _make_output(req, data, {
+                "model": model_name,
+                "prompt_version": prompt_version,
+                "prompt_tokens_est": compiled.total_tokens,
+                "prompt_truncated": compiled.truncated,
+                "attempt": attempt,
+                "essay_type": req.essay_type,
+                "json_repair": repaired,
+                "local_repair": local_fixes,
+                "salvaged_keys": salvaged,
+                "structured_output": structured,
+            })
 
             validate_score_output(out)
+            _record_repair(local_fixes, repaired, salvaged)
             return out
 
+        except DeadlineExceeded as e:
+            raise DeadlineExceeded(str(e), partial=best) from None
         except Exception as e:
+            # повторяем только невалидный ответ; ошибки транспорта клиент уже повторил,
+            # а 4xx / открытый предохранитель повтор не исправит
+            if classify(e) != CONTENT:
+                raise
             last_err = e
 
     raise RuntimeError(f"LLM scoring failed after retry: {last_err}")
+
+
+async def ascore_essay(req: ScoreRequest, cache_mode: str = CACHE_USE, deadline: Optional[Deadline] = None) -> Dict:
+    """
+    Асинхронный score_essay: пока одно сочинение ждёт ответа GigaChat,
+    event loop обслуживает остальные. Вызывать внутри app context.
+    """
+    app = current_app._get_current_object()
+
+    def _run() -> Dict:
+        with app.app_context():
+            return score_essay(req, cache_mode=cache_mode, deadline=deadline)
+
+    return await asyncio.to_thread(_run)
+
+
+def pack_key(req: ScoreRequest) -> Tuple:
+    """Сочинения с одинаковым ключом можно оценивать одним вызовом (общий контекст)."""
+    return (req.essay_type, req.task_text, req.reference_text_essay)
+
+
+def max_pack_size() -> int:
+    """
+    Сколько сочинений можно оценить одним вызовом: ответ пачки — MAX_TOKENS на сочинение
+    в пределах GIGACHAT_MAX_OUTPUT_TOKENS. Со structured output пачки не собираем (1):
+    схема функции описывает ответ на одно сочинение.
+    """
+    if current_app.config.get("GIGACHAT_STRUCTURED_OUTPUT", False):
+        return 1
+    max_tokens = int(current_app.config.get("MAX_TOKENS", 900))
+    limit = int(current_app.config.get("GIGACHAT_MAX_OUTPUT_TOKENS", 4096))
+    return max(1, limit // max(1, max_tokens))
+
+
+def _pack_answers(raw: str) -> Dict[str, dict]:
+    """Ответ пачки -> {essay_id: поля ответа}."""
+    by_id = {}
+    for obj in extract_json_objects(raw):
+        essay_id = obj.get("essay_id")
+        if essay_id is not None:
+            by_id[str(essay_id)] = normalize_keys(obj)
+    return by_id
+
+
+def score_pack(
+    reqs: List[ScoreRequest], cache_mode: str = CACHE_USE, deadline: Optional[Deadline] = None
+) -> Dict[str, Dict]:
+    """
+    Оценивает несколько сочинений с общим pack_key одним вызовом LLM.
+    Возвращает {essay_id: результат} только для сочинений с полным валидным ответом;
+    остальные вызывающий код оценивает по одному (score_essay).
+    Пачка больше max_pack_size() (в том числе любая при structured output) — ValueError.
+    """
+    if not reqs:
+        return {}
+    if len({pack_key(r) for r in reqs}) != 1:
+        raise ValueError("score_pack: essays must share essay_type, task_text and reference_text_essay")
+    ids = [r.essay_id for r in reqs]
+    if any(i is None for i in ids) or len(set(ids)) != len(ids):
+        raise ValueError("score_pack: essay_id must be set and unique within a pack")
+    if len(reqs) > max_pack_size():
+        raise ValueError(
+            f"score_pack: pack of {len(reqs)} essays exceeds max pack size {max_pack_size()} "
+            "(GIGACHAT_MAX_OUTPUT_TOKENS // MAX_TOKENS, 1 with GIGACHAT_STRUCTURED_OUTPUT)"
+        )
+
+    client = _get_client()
+    model_name = current_app.config.get("GIGACHAT_MODEL", "GigaChat")
+    temperature = float(current_app.config.get("TEMPERATURE", 0.0))
+    max_tokens = int(current_app.config.get("MAX_TOKENS", 900))
+    prompt_version = current_app.config.get("PROMPT_VERSION", PROMPT_VERSION)
+
+    def _complete(raw: str) -> bool:
+        # в кеш — только ответ с полными валидными оценками всех сочинений пачки
+        by_id = _pack_answers(raw)
+        return all(NEEDED_KEYS.issubset(_valid_fields(by_id.get(str(i)))) for i in ids)
+
+    raw = client.chat_completion(
+        model=model_name,
+        prompt=build_packed_prompt(reqs, version=prompt_version),
+        temperature=temperature,
+        max_tokens=max_tokens * len(reqs),
+        cache_mode=cache_mode,
+        deadline=deadline,
+        cache_if=_complete,
+    )
+
+    by_id = _pack_answers(raw)
+    out = {}
+    for req in reqs:
+        data = _valid_fields(by_id.get(str(req.essay_id)))
+        if not NEEDED_KEYS.issubset(data):
+            continue
+        res = _make_output(req, data, {
+            "model": model_name,
+            "prompt_version": prompt_version,
+            "attempt": 0,
+            "essay_type": req.essay_type,
+            "json_repair": False,
+            "local_repair": [],
+            "salvaged_keys": [],
+            "structured_output": False,
+            "packed": len(reqs),
+        })
+        validate_score_output(res)
+        _record_repair([], False, [])
+        out[str(req.essay_id)] = res
+    return out
+
+
+async def ascore_pack(
+    reqs: List[ScoreRequest], cache_mode: str = CACHE_USE, deadline: Optional[Deadline] = None
+) -> Dict[str, Dict]:
+    """Асинхронный score_pack (см. ascore_essay)."""
+    app = current_app._get_current_object()
+
+    def _run() -> Dict[str, Dict]:
+        with app.app_context():
+            return score_pack(reqs, cache_mode=cache_mode, deadline=deadline)
+
+    return await asyncio.to_thread(_run)
@@ -0,0 +1,70 @@
+import logging
+import time
+from typing import Dict
+
+from flask import Flask
+
+# Что и сколько грелось в этом процессе (для /api/metrics)
+_REPORT: Dict = {}
+
+
+def _step(name: str, fn) -> None:
+    started = time.perf_counter()
+    try:
+        fn()
+        _REPORT[name] = {"ok": True, "ms": round((time.perf_counter() - started) * 1000, 1)}
+    except Exception as e:
+        # прогрев не должен ронять старт: первый запрос пройдёт обычным (медленным) путём
+        _REPORT[name] = {"ok": False, "ms": round((time.perf_counter() - started) * 1000, 1), "error": str(e)}
+        logging.getLogger(__name__).warning("warmup %s failed: %s", name, e)
+
+
+def warm_data(app: Flask) -> Dict:
+    """
+    Загружает входные данные и индекс /api/essays. При gunicorn --preload вызывается
+    в мастере до fork: данные и mmap-страницы достаются воркерам готовыми.
+    """
+    from .data_store import load_inputs
+    from .essay_index import get_index
+
+    with app.app_context():
+        _step("data", load_inputs)
+        _step("essay_index", lambda: get_index(load_inputs(), app.config["PERSIST_DIR"]))
+    return dict(_REPORT)
+
+
+def warm_client(app: Flask) -> Dict:
+    """Создаёт клиент GigaChat процесса и заранее получает OAuth-токен (если токен задан)."""
+    from .scoring import _get_client
+
+    if not app.config.get("GIGACHAT_TOKEN"):
+        return dict(_REPORT)
+    with app.app_context():
+        _step("gigachat_token", lambda: _get_client()._get_access_token())
+    return dict(_REPORT)
+
+
+def after_fork() -> None:
+    """
+    В воркере сразу после fork: клиент (сокеты пула, SQLite-кеш) и соединение
+    индекса /api/essays родителя не используем — следующий вызов создаст свои.
+    Данные (снимок data_store) остаются общими.
+    """
+    from .scoring import reset_client
+    from .essay_index import reset_index
+
+    reset_client()
+    reset_index()
+
+
+def start_background(app: Flask) -> None:
+    """Фоновые потоки процесса: разбор очереди /jobs и слежение за файлами данных."""
+    from .jobs import start_workers
+    from .data_store import start_watcher
+
+    start_workers(app)
+    start_watcher(app.config["DATA_RELOAD_INTERVAL_SEC"])
+
+
+def warmup_report() -> Dict:
+    return dict(_REPORT)
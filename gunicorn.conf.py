@@ -0,0 +1,30 @@
+"""
+Конфигурация gunicorn: gunicorn -c gunicorn.conf.py wsgi:app
+
+preload_app — приложение (и входные данные с индексом /api/essays, см. WARMUP_ON_START)
+загружается один раз в мастере, воркеры получают их через fork готовыми (copy-on-write).
+После fork каждый воркер закрывает унаследованные соединения, запускает свои фоновые
+потоки и заранее получает OAuth-токен GigaChat.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '80')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+timeout = 120
+preload_app = True
+
+
+def post_fork(server, worker):
+    from app.warmup import after_fork
+
+    after_fork()
+
+
+def post_worker_init(worker):
+    from app.warmup import start_background, warm_client
+
+    app = worker.wsgi
+    # потоки не переживают fork — запускаем их в каждом воркере
+    start_background(app)
+    if app.config["WARMUP_ON_START"]:
+        warm_client(app)
@@ -10,14 +10,24 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from app import create_app
+from app.warmup import start_background, warm_client
 
 if __name__ == "__main__":
-    app = create_app()
-    
     # Параметры запуска
+    debug = os.getenv("DEBUG", "True").lower() == "true"
+    # в debug-режиме reloader-родитель запросы не обслуживает — греем только рабочий процесс
+    serving = not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+
+    app = create_app(warmup=serving)
+    
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", 8080))
-    debug = os.getenv("DEBUG", "True").lower() == "true"
+
+    # фоновые потоки (/jobs, перезагрузка данных) и OAuth-токен — только в процессе, который обслуживает запросы
+    if serving:
+        start_background(app)
+        if app.config["WARMUP_ON_START"]:
+            warm_client(app)
     
     print(f"🚀 Запуск приложения на http://{host}:{port}")
     print(f"📝 Веб-интерфейс: http://localhost:{port}/ui")
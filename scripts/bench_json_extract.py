@@ -0,0 +1,209 @@
+"""
+Фаззинг и микро-бенчмарк извлечения JSON из ответа модели:
+старый алгоритм (все пары { ... }, O(n²)) против однопроходного сканера app.json_utils.
+
+Корпус:
+- реальные ответы GigaChat из кеша LLM (LLM_CACHE_PATH), если он есть;
+- синтетический фазз-корпус с фиксированным seed (воспроизводимый).
+
+Старый алгоритм строит все пары скобок и на длинных ответах съедает минуты и гигабайты,
+поэтому тексты, где пар больше --legacy-max-pairs, сравниваются и замеряются
+только для сканера (их число печатается как legacy_skipped).
+
+Запуск:
+    python scripts/bench_json_extract.py [--fuzz 2000] [--repeat 5] [--seed 42] [--legacy-max-pairs 10000]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+from app.config import Config
+from app.json_utils import _normalize_quotes, _try_load, extract_json
+
+
+def extract_json_legacy(text: str) -> dict:
+    """Прежняя реализация extract_json (для сравнения)."""
+    if text is None:
+        raise ValueError("Empty text")
+
+    text = _normalize_quotes(text.strip())
+    try:
+        return _try_load(text)
+    except Exception:
+        pass
+
+    candidates = []
+    starts = [m.start() for m in re.finditer(r"\{", text)]
+    ends = [m.start() for m in re.finditer(r"\}", text)]
+    for i in starts:
+        for j in ends:
+            if j > i:
+                candidates.append(text[i:j + 1])
+    candidates.sort(key=len, reverse=True)
+
+    last_err = None
+    for cand in candidates[:50]:
+        cand2 = cand.strip().replace("```json", "").replace("```", "").strip()
+        try:
+            obj = _try_load(cand2)
+            if isinstance(obj, dict):
+                return obj
+        except Exception as e:
+            last_err = e
+    raise ValueError(f"Could not extract valid JSON. Last error: {last_err}")
+
+
+_WORDS = (
+    "позиция автора ясна пример из текста пояснение роли вывод есть аргумент "
+    "сочинение рассуждение логика композиция вступление основная часть"
+).split()
+_NOISE = ["{", "}", "{}", "{пример}", "\\\"", "«цитата»", "'", ",", ":", "\n", "```"]
+
+
+def _sentence(rng: random.Random, noisy: bool) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(4, 30))]
+    if noisy:
+        for _ in range(rng.randint(1, 6)):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(_NOISE))
+    return " ".join(words)
+
+
+def _brace_heavy_case(rng: random.Random) -> str:
+    """Длинный ответ с большим количеством скобок вокруг JSON — худший случай для O(n²)."""
+    junk = " ".join(_sentence(rng, True) for _ in range(rng.randint(40, 80)))
+    body = _fuzz_case(rng)
+    return f"{junk}\n{body}\n{junk}"
+
+
+def _fuzz_case(rng: random.Random) -> str:
+    obj = {}
+    for k, hi in (("K1", 1), ("K2", 3), ("K3", 2), ("K4", 1)):
+        obj[k] = rng.randint(0, hi)
+        expl = _sentence(rng, noisy=False)
+        if rng.random() < 0.3:
+            expl += " {в скобках} и \"цитата\""
+        obj[f"{k}_explanation"] = expl
+    body = json.dumps(obj, ensure_ascii=False, indent=rng.choice([None, 2]))
+
+    variant = rng.random()
+    if variant < 0.2:
+        return body
+    if variant < 0.4:
+        return f"```json\n{body}\n```"
+    if variant < 0.6:
+        return f"{_sentence(rng, True)}\n{body}\n{_sentence(rng, True)}"
+    if variant < 0.75:
+        # «брейс-тяжёлый» ответ: много мусорных скобок вокруг
+        junk = " ".join(_sentence(rng, True) for _ in range(rng.randint(5, 20)))
+        return f"{junk}\n{body}\n{junk}"
+    if variant < 0.9:
+        # обрезанный ответ
+        return body[: rng.randint(1, len(body))]
+    # случайная порча одного символа
+    pos = rng.randrange(len(body))
+    return body[:pos] + rng.choice(_NOISE) + body[pos + 1:]
+
+
+def load_real_outputs(path: str):
+    if not path or not os.path.exists(path):
+        return []
+    try:
+        conn = sqlite3.connect(path)
+        rows = conn.execute("SELECT value FROM llm_cache").fetchall()
+        conn.close()
+    except sqlite3.Error:
+        return []
+    return [r[0] for r in rows]
+
+
+def _brace_pairs(text: str) -> int:
+    """Сколько кандидатов { ... } перебирает старый алгоритм (оценка сверху)."""
+    return text.count("{") * text.count("}")
+
+
+def _run(fn, text):
+    try:
+        return fn(text)
+    except ValueError:
+        return None
+
+
+def _bench(fn, corpus, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for text in corpus:
+            _run(fn, text)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--fuzz", type=int, default=2000, help="размер синтетического корпуса")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--cache", default=Config.LLM_CACHE_PATH, help="SQLite-кеш с реальными ответами GigaChat")
+    ap.add_argument("--legacy-max-pairs", type=int, default=10000,
+                    help="тексты с большим числом пар скобок старым алгоритмом не гоняем")
+    args = ap.parse_args()
+
+    def legacy_ok(text: str) -> bool:
+        return _brace_pairs(text) <= args.legacy_max_pairs
+
+    rng = random.Random(args.seed)
+    fuzz = [_fuzz_case(rng) for _ in range(args.fuzz)]
+    heavy = [_brace_heavy_case(rng) for _ in range(max(1, args.fuzz // 20))]
+    real = load_real_outputs(args.cache)
+
+    # 1) фаззинг: новый сканер не должен терять объекты, которые находил старый
+    regressions = 0
+    improved = 0
+    skipped = 0
+    for text in fuzz + heavy + real:
+        if not legacy_ok(text):
+            skipped += 1
+            continue
+        old, new = _run(extract_json_legacy, text), _run(extract_json, text)
+        if old is not None and new is None:
+            regressions += 1
+        elif old is None and new is not None:
+            improved += 1
+    print(
+        f"fuzz: cases={len(fuzz) + len(heavy)} real={len(real)} "
+        f"regressions={regressions} newly_parsed={improved} legacy_skipped={skipped}"
+    )
+
+    # 2) микро-бенчмарк
+    for name, corpus in (("fuzz", fuzz), ("brace_heavy", heavy), ("real", real)):
+        if not corpus:
+            print(f"{name}: пусто, пропускаем")
+            continue
+        # сравниваем на одном и том же (ограниченном) подмножестве
+        bounded = [t for t in corpus if legacy_ok(t)]
+        if bounded:
+            t_old = _bench(extract_json_legacy, bounded, args.repeat)
+            t_new = _bench(extract_json, bounded, args.repeat)
+            print(
+                f"{name}: legacy={t_old * 1000:.1f} ms  scanner={t_new * 1000:.1f} ms  "
+                f"speedup=x{t_old / t_new:.1f}  ({len(bounded)} texts, best of {args.repeat})"
+            )
+        if len(bounded) < len(corpus):
+            t_all = _bench(extract_json, corpus, args.repeat)
+            print(
+                f"{name}: scanner on all {len(corpus)} texts={t_all * 1000:.1f} ms  "
+                f"(legacy_skipped={len(corpus) - len(bounded)})"
+            )
+
+
+if __name__ == "__main__":
+    main()
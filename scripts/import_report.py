@@ -0,0 +1,69 @@
+"""
+Отчёт о времени старта: импорт пакета app (python -X importtime) и прогрев
+(загрузка данных и индекса /api/essays, как при create_app(warmup=True)).
+
+Показывает самые дорогие модули по суммарному (cumulative) времени импорта —
+чтобы тяжёлые зависимости (pandas, pyarrow, clearml) не попадали в импорт приложения.
+
+Запуск:
+    python scripts/import_report.py [--top 15] [--module app] [--no-warmup]
+"""
+import argparse
+import json
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# строка -X importtime: "import time:  self [us] | cumulative | imported package"
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S.*)$")
+
+
+def import_times(module: str):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=str(ROOT), capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            self_us, cum_us, indent, name = m.groups()
+            rows.append({"module": name, "self_us": int(self_us), "cum_us": int(cum_us), "depth": len(indent) // 2})
+    return rows
+
+
+def warmup_times():
+    sys.path.append(str(ROOT))
+    from app import create_app
+    from app.warmup import warmup_report
+
+    create_app(warmup=True)
+    return warmup_report()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--module", default="app")
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--no-warmup", action="store_true", help="только импорт, без загрузки данных")
+    args = ap.parse_args()
+
+    rows = import_times(args.module)
+    total = next((r["cum_us"] for r in rows if r["module"] == args.module), sum(r["self_us"] for r in rows))
+    print(f"import {args.module}: {total / 1000:.1f} ms, modules={len(rows)}")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for r in sorted(rows, key=lambda r: r["cum_us"], reverse=True)[: args.top]:
+        print(f"{r['cum_us'] / 1000:>14.1f} {r['self_us'] / 1000:>9.1f}  {r['module']}")
+
+    if not args.no_warmup:
+        print("\nwarmup:")
+        print(json.dumps(warmup_times(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
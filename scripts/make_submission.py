@@ -1,4 +1,23 @@
+"""
+Оценивает все сочинения из data/ и пишет data/submission.csv.
+
+Каждый результат (успех или ошибка) сразу дописывается в журнал JSONL
+(data/submission_journal.jsonl), поэтому прерванный запуск продолжается с места
+остановки: --resume пропускает уже оценённые сочинения. Упавшие сочинения
+переоцениваются в конце (--retry-rounds раундов, без чтения кеша LLM). CSV пишется только когда
+оценены все сочинения; иначе скрипт завершается с кодом 1, журнал сохраняется.
+Новый запуск (без --resume) не затирает прежний журнал, а переименовывает его
+в <имя>.<время>.jsonl — прогресс прерванного запуска можно вернуть.
+
+Запуск:
+    python scripts/make_submission.py [--concurrency 4] [--pack-size 1] [--resume]
+                                      [--retry-rounds 2] [--journal PATH] [--out PATH]
+"""
+import argparse
+import json
 import sys
+import threading
+import time
 from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv()
@@ -10,63 +29,236 @@ print("TOKEN LOADED:", bool(os.getenv("GIGACHAT_TOKEN")))
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.append(str(ROOT))
 
-import os
 import pandas as pd
 
 from app import create_app
 from app.schemas import ScoreRequest
-from app.scoring import score_essay
+from app.batch import score_batch
+from app.data_store import load_inputs
+from app.scoring import check_circuit
+from app.circuit_breaker import CircuitOpenError
+from app.llm_cache import CACHE_BYPASS, CACHE_MODES, CACHE_REFRESH
 
 
 DATA_DIR = Path("data")
-IN_PATH = DATA_DIR / "inputs_for_scoring.csv"
 OUT_PATH = DATA_DIR / "submission.csv"
+JOURNAL_PATH = DATA_DIR / "submission_journal.jsonl"
+
+
+class Journal:
+    """
+    Журнал запуска (append-only JSONL): первая строка — параметры запуска,
+    далее по строке на каждый результат. Для сочинения действует последняя запись.
+    """
+
+    def __init__(self, path: Path, run_info: dict, resume: bool):
+        self.path = path
+        self.results = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+        if resume and path.exists():
+            self._read(run_info)
+            self._fh = open(path, "a", encoding="utf-8")
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._rotate()
+            self._fh = open(path, "x", encoding="utf-8")
+            self._write({"run": run_info})
+
+    def _rotate(self) -> None:
+        # прежний журнал откладываем в сторону, а не обрезаем
+        if not self.path.exists() or self.path.stat().st_size == 0:
+            self.path.unlink(missing_ok=True)
+            return
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.path.stat().st_mtime))
+        old = self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}")
+        n = 1
+        while old.exists():
+            old = self.path.with_name(f"{self.path.stem}.{stamp}-{n}{self.path.suffix}")
+            n += 1
+        self.path.rename(old)
+        print(f"Journal: previous run moved to {old} (use --resume to continue a run)")
+
+    def _read(self, run_info: dict) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            for n, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    # последняя строка могла оборваться при падении — её сочинение оценим заново
+                    print(f"Journal: skipping broken line {n}")
+                    continue
+                if "run" in rec:
+                    if rec["run"] != run_info:
+                        raise SystemExit(
+                            f"Journal {self.path} was written with other settings {rec['run']}, "
+                            f"now {run_info}. Run without --resume to start over."
+                        )
+                    continue
+                essay_id = str(rec["essay_id"])
+                if rec["ok"]:
+                    self.results[essay_id] = rec["result"]
+                    self.errors.pop(essay_id, None)
+                else:
+                    self.errors[essay_id] = rec["error"]
+
+    def _write(self, rec: dict) -> None:
+        with self._lock:
+            self._fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._fh.flush()
+
+    def record(self, entry: dict) -> None:
+        essay_id = str(entry["essay_id"])
+        rec = {"essay_id": essay_id, "ok": entry["ok"], "elapsed_ms": entry["elapsed_ms"], "ts": time.time()}
+        if entry["ok"]:
+            rec["result"] = entry["result"]
+            self.results[essay_id] = entry["result"]
+            self.errors.pop(essay_id, None)
+        else:
+            rec["error"] = entry["error"]
+            self.errors[essay_id] = entry["error"]
+        self._write(rec)
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+def _wait_for_backend(app) -> None:
+    # GigaChat недоступен (предохранитель открыт) — ждём, а не тратим раунд на мгновенные отказы
+    with app.app_context():
+        while True:
+            try:
+                check_circuit()
+                return
+            except CircuitOpenError as e:
+                print(f"GigaChat unavailable, waiting {e.retry_after:.0f}s: {e}")
+                time.sleep(max(1.0, e.retry_after))
+
+
+def _score(app, reqs, journal: Journal, args, cache_mode: str, label: str) -> None:
+    total = len(reqs)
+    done = [0, 0]  # ok, failed
+    step = max(1, total // 20)
+    started = time.perf_counter()
+
+    def on_result(i, entry):
+        journal.record(entry)
+        done[0 if entry["ok"] else 1] += 1
+        n = done[0] + done[1]
+        if n % step == 0 or n == total:
+            print(f"{label}: {n}/{total} ok={done[0]} failed={done[1]} "
+                  f"elapsed={time.perf_counter() - started:.0f}s")
+
+    with app.app_context():
+        score_batch(
+            reqs, concurrency=args.concurrency, cache_mode=cache_mode,
+            pack_size=args.pack_size, on_result=on_result,
+        )
+
 
 def main():
-    if not IN_PATH.exists():
-        raise FileNotFoundError(f"Not found: {IN_PATH}. Run scripts/prepare_inputs.py first.")
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", type=int,
+                    default=int(os.getenv("SUBMISSION_CONCURRENCY", os.getenv("SCORING_CONCURRENCY", "4"))),
+                    help="сколько сочинений оцениваем одновременно")
+    ap.add_argument("--pack-size", type=int,
+                    default=int(os.getenv("SUBMISSION_PACK_SIZE", os.getenv("SCORING_PACK_SIZE", "1"))),
+                    help="сколько сочинений с общим опорным текстом оценивать одним вызовом LLM")
+    ap.add_argument("--resume", action="store_true", help="продолжить по журналу, пропуская оценённые")
+    ap.add_argument("--retry-rounds", type=int, default=2, help="сколько раз переоценить упавшие в конце")
+    ap.add_argument("--journal", type=Path, default=JOURNAL_PATH)
+    ap.add_argument("--out", type=Path, default=OUT_PATH)
+    args = ap.parse_args()
 
     # Обычно валидатору нужны только баллы
     only_scores = os.getenv("SUBMISSION_ONLY_SCORES", "1") == "1"
+    # LLM_CACHE_MODE=refresh — переоценить всё заново, не читая кеш ответов
+    cache_mode = os.getenv("LLM_CACHE_MODE", "use")
+    if cache_mode not in CACHE_MODES:
+        raise SystemExit(f"LLM_CACHE_MODE={cache_mode!r} is invalid, expected one of {CACHE_MODES}")
 
-    df = pd.read_csv(IN_PATH, encoding="utf-8")
-
+    # Arrow (memory map), нормализованный CSV или прежний inputs_for_scoring.csv — см. data_store
+    dataset = load_inputs()
     app = create_app()
+
+    # результаты с другой версией промпта/моделью смешивать нельзя
+    run_info = {
+        "prompt_version": app.config.get("PROMPT_VERSION"),
+        "model": app.config.get("GIGACHAT_MODEL"),
+        "data_digest": dataset.digest,
+    }
+    journal = Journal(args.journal, run_info, resume=args.resume)
+
+    reqs = [
+        ScoreRequest(
+            essay_id=r.essay_id,
+            essay_text=r.essay_text,
+            reference_text_essay=r.reference_text_essay,
+            task_text=r.task_text,
+            essay_type=r.essay_type,
+        )
+        for r in dataset
+    ]
+    if args.resume:
+        print(f"Resume: {len(journal.results)} already scored, {len(journal.errors)} failed earlier")
+
+    try:
+        todo = [r for r in reqs if str(r.essay_id) not in journal.results]
+        if todo:
+            _score(app, todo, journal, args, cache_mode, "score")
+
+        for round_no in range(1, args.retry_rounds + 1):
+            todo = [r for r in reqs if str(r.essay_id) not in journal.results]
+            if not todo:
+                break
+            _wait_for_backend(app)
+            # упавшие переоцениваем мимо кеша: кешированный ответ дал бы ту же ошибку
+            retry_mode = CACHE_BYPASS if cache_mode == CACHE_BYPASS else CACHE_REFRESH
+            _score(app, todo, journal, args, retry_mode, f"retry {round_no}")
+    finally:
+        journal.close()
+
+    missing = [str(r.essay_id) for r in reqs if str(r.essay_id) not in journal.results]
+    if missing:
+        first = missing[0]
+        print(
+            f"Not saved: {len(missing)} essays still failed, first essay_id={first}: "
+            f"{journal.errors.get(first)}. Progress is in {args.journal}, rerun with --resume."
+        )
+        sys.exit(1)
+
     rows = []
+    for r in reqs:
+        out = journal.results[str(r.essay_id)]
 
-    with app.app_context():
-        for _, r in df.iterrows():
-            req = ScoreRequest(
-                essay_id=str(r["essay_id"]),
-                essay_text=str(r["essay_text"]),
-                reference_text_essay=str(r["reference_text_essay"]),
-                task_text=str(r["task_text"]),
-                essay_type=int(r["essay_type"]),
-            )
-
-            out = score_essay(req)
-
-            row = {
-                "essay_id": str(out["essay_id"]),
-                "K1": int(out["K1"]),
-                "K2": int(out["K2"]),
-                "K3": int(out["K3"]),
-                "K4": int(out["K4"]),
-            }
-
-            if not only_scores:
-                row.update({
-                    "K1_explanation": out["K1_explanation"],
-                    "K2_explanation": out["K2_explanation"],
-                    "K3_explanation": out["K3_explanation"],
-                    "K4_explanation": out["K4_explanation"],
-                })
-
-            rows.append(row)
+        row = {
+            "essay_id": str(out["essay_id"]),
+            "K1": int(out["K1"]),
+            "K2": int(out["K2"]),
+            "K3": int(out["K3"]),
+            "K4": int(out["K4"]),
+        }
+
+        if not only_scores:
+            row.update({
+                "K1_explanation": out["K1_explanation"],
+                "K2_explanation": out["K2_explanation"],
+                "K3_explanation": out["K3_explanation"],
+                "K4_explanation": out["K4_explanation"],
+            })
+
+        rows.append(row)
 
     sub = pd.DataFrame(rows)
-    sub.to_csv(OUT_PATH, index=False, encoding="utf-8")
-    print(f"Saved: {OUT_PATH} rows={len(sub)}")
+    # атомарно: неполный submission.csv не появится даже при падении во время записи
+    tmp = args.out.with_name(args.out.name + ".tmp")
+    sub.to_csv(tmp, index=False, encoding="utf-8")
+    os.replace(tmp, args.out)
+    print(f"Saved: {args.out} rows={len(sub)}")
 
 if __name__ == "__main__":
     main()
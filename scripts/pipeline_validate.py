@@ -8,10 +8,8 @@ from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
 
-import pandas as pd
 import requests
 from dotenv import load_dotenv
-from clearml import Task
 
 # Подтягиваем .env (важно для токенов/параметров)
 load_dotenv()
@@ -50,6 +48,8 @@ def send_to_validator(submission_path: Path) -> dict:
     if not user_id:
         raise RuntimeError("VALIDATOR_USER_ID is not set in .env")
 
+    import pandas as pd
+
     df = pd.read_csv(submission_path, encoding="utf-8")
 
     rows = []
@@ -117,6 +117,9 @@ def main():
 
     # Важно: попытки ограничены. Не запускайте лишний раз.
     # --- стартуем ClearML task ---
+    # clearml (и pandas в send_to_validator) тяжёлые — импортируем только когда нужны
+    from clearml import Task
+
     task = Task.init(
         project_name="OGE Essay Scoring",
         task_name=f"Pipeline validation {prompt_version}"
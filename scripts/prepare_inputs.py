@@ -1,9 +1,94 @@
+"""
+Готовит входные данные для data_store из data/essays.csv и data/reference_text*.csv.
+
+По умолчанию пишет нормализованный формат (опорный текст и задание хранятся один раз):
+    data/inputs_essays.csv      essay_id, essay_type, reference_text_id, essay_text
+    data/inputs_references.csv  reference_text_id, task_text, reference_text_essay
+
+--format arrow дополнительно пишет те же таблицы в Arrow IPC (нужен pyarrow);
+без него Arrow-файлы прошлых запусков удаляются:
+    data/inputs_essays.arrow      + готовые essay_preview / essay_length для /api/essays
+    data/inputs_references.arrow
+data_store открывает их через memory map (CSV остаётся запасным вариантом).
+
+--legacy дополнительно пишет прежний денормализованный data/inputs_for_scoring.csv.
+
+Запуск:
+    python scripts/prepare_inputs.py [--format csv|arrow] [--legacy]
+"""
+import argparse
+import os
+import sys
+
 import pandas as pd
 from pathlib import Path
 
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+from app.data_store import (
+    ESSAYS_FILE,
+    REFERENCES_FILE,
+    LEGACY_FILE,
+    ESSAYS_ARROW_FILE,
+    REFERENCES_ARROW_FILE,
+)
+
 DATA_DIR = Path("data")
 
+
+def _save(out: Path, write) -> None:
+    """
+    Пишет во временный файл и атомарно подменяет out: запущенное приложение
+    (горячая перезагрузка, memory map) никогда не видит файл наполовину записанным.
+    """
+    tmp = out.with_name(out.name + ".tmp")
+    write(tmp)
+    os.replace(tmp, out)
+
+
+def write_arrow(essays: pd.DataFrame, refs: pd.DataFrame) -> None:
+    import pyarrow as pa
+
+    essay_text = essays["essay_text"].astype(str)
+    essays_table = pa.table({
+        "essay_id": pa.array(essays["essay_id"].astype(str), pa.string()),
+        "essay_type": pa.array(essays["essay_type"].astype(int), pa.int8()),
+        "reference_text_id": pa.array(essays["reference_text_id"].astype(int), pa.int32()),
+        "essay_text": pa.array(essay_text, pa.large_string()),
+        # превью и длина для /api/essays — чтобы список не читал тексты целиком
+        "essay_preview": pa.array(
+            [t[:100] + "..." if len(t) > 100 else t for t in essay_text], pa.string()
+        ),
+        "essay_length": pa.array([len(t) for t in essay_text], pa.int32()),
+    })
+    refs_table = pa.table({
+        "reference_text_id": pa.array(refs["reference_text_id"].astype(int), pa.int32()),
+        "task_text": pa.array(refs["task_text"].astype(str), pa.string()),
+        "reference_text_essay": pa.array(refs["reference_text_essay"].astype(str), pa.large_string()),
+    })
+
+    def _writer(table):
+        def write(path: Path) -> None:
+            # без сжатия: файл читается через memory map без копирования
+            with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        return write
+
+    # справочник раньше сочинений: новые сочинения всегда найдут свой reference_text_id
+    for table, name in ((refs_table, REFERENCES_ARROW_FILE), (essays_table, ESSAYS_ARROW_FILE)):
+        out = DATA_DIR / name
+        _save(out, _writer(table))
+        print(f"Saved: {out} rows={table.num_rows}")
+
+
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--format", choices=["csv", "arrow"], default="csv",
+                    help="arrow — также записать Arrow IPC для memory-mapped загрузки")
+    ap.add_argument("--legacy", action="store_true", help="также записать denormalized inputs_for_scoring.csv")
+    args = ap.parse_args()
+
     essays = pd.read_csv(DATA_DIR / "essays.csv")
 
     refs = []
@@ -11,19 +96,46 @@ def main():
         refs.append(pd.read_csv(DATA_DIR / f"reference_text{i}.csv"))
     refs = pd.concat(refs, ignore_index=True)
 
-    df = essays.merge(refs, on="reference_text_id", how="left")
-
-    df = df.rename(columns={
+    refs = refs.rename(columns={
         "task": "task_text",
         "reference_text": "reference_text_essay",
     })
 
-    need_cols = ["essay_id", "essay_type", "task_text", "reference_text_essay", "essay_text"]
-    df = df[need_cols]
+    unknown = sorted(set(essays["reference_text_id"]) - set(refs["reference_text_id"]))
+    if unknown:
+        raise ValueError(f"essays.csv references unknown reference_text_id: {unknown}")
+
+    essays_out = essays[["essay_id", "essay_type", "reference_text_id", "essay_text"]]
+    refs_out = refs[["reference_text_id", "task_text", "reference_text_essay"]].drop_duplicates("reference_text_id")
+
+    # справочник раньше сочинений: новые сочинения всегда найдут свой reference_text_id
+    out = DATA_DIR / REFERENCES_FILE
+    _save(out, lambda path: refs_out.to_csv(path, index=False, encoding="utf-8"))
+    print(f"Saved: {out} rows={len(refs_out)}")
+
+    out = DATA_DIR / ESSAYS_FILE
+    _save(out, lambda path: essays_out.to_csv(path, index=False, encoding="utf-8"))
+    print(f"Saved: {out} rows={len(essays_out)}")
+
+    if args.format == "arrow":
+        write_arrow(essays_out, refs_out)
+    else:
+        # Arrow от прошлого запуска устарел: data_store иначе продолжил бы отдавать его
+        for name in (ESSAYS_ARROW_FILE, REFERENCES_ARROW_FILE):
+            stale = DATA_DIR / name
+            if stale.exists():
+                stale.unlink()
+                print(f"Removed stale: {stale}")
+
+    if args.legacy:
+        df = essays.merge(refs, on="reference_text_id", how="left")
+        need_cols = ["essay_id", "essay_type", "task_text", "reference_text_essay", "essay_text"]
+        df = df[need_cols]
+
+        out = DATA_DIR / LEGACY_FILE
+        _save(out, lambda path: df.to_csv(path, index=False, encoding="utf-8"))
+        print(f"Saved: {out} rows={len(df)}")
 
-    out = DATA_DIR / "inputs_for_scoring.csv"
-    df.to_csv(out, index=False, encoding="utf-8")
-    print(f"Saved: {out} rows={len(df)}")
 
 if __name__ == "__main__":
     main()
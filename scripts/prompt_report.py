@@ -0,0 +1,44 @@
+"""
+Размер промптов по версиям шаблонов (оценка в токенах) на входных данных data_store.
+
+Запуск:
+    python scripts/prompt_report.py [path/to/data_dir | path/to/inputs_for_scoring.csv]
+"""
+import json
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+from app.schemas import ScoreRequest
+from app.prompting import prompt_size_report
+from app.data_store import load_inputs
+
+
+def main():
+    dataset = load_inputs(sys.argv[1] if len(sys.argv) > 1 else None)
+
+    reqs = [
+        ScoreRequest(
+            essay_id=r.essay_id,
+            essay_text=r.essay_text,
+            reference_text_essay=r.reference_text_essay,
+            task_text=r.task_text,
+            essay_type=r.essay_type,
+        )
+        for r in dataset
+    ]
+
+    report = prompt_size_report(reqs)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    versions = sorted(report)
+    base = report[versions[0]]["avg_tokens"]
+    for v in versions[1:]:
+        saved = base - report[v]["avg_tokens"]
+        print(f"{v} vs {versions[0]}: {saved:+.1f} tokens/essay ({100 * saved / base:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,9 @@ if str(project_root) not in sys.path:
 
 from app import create_app
 
-app = create_app()
+# данные и индекс грузятся здесь (в мастере при preload_app); фоновые потоки /jobs
+# и слежение за файлами данных запускает post_worker_init в gunicorn.conf.py
+app = create_app(warmup=True)
 
 # Проверка при импорте (только для отладки)
 if __name__ == "__main__":